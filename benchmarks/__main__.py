@@ -0,0 +1,78 @@
+"""Offline benchmarks for the wallet, storage and history hot paths.
+
+    python -m benchmarks --out before.json
+    python -m benchmarks --out after.json --compare before.json --only derive storage
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import platform
+import subprocess
+import sys
+from importlib.metadata import version
+from typing import Any, Dict, List
+
+from .suite import run
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(baseline: Dict[str, Any], results: List[Dict[str, Any]]):
+    def key(r):
+        return r["name"], json.dumps(r["params"], sort_keys=True)
+
+    before = {key(r): r for r in baseline["results"]}
+    print(f"Compared with {baseline['meta']['commit']} (median, lower is better):", file=sys.stderr)
+    for r in results:
+        old = before.get(key(r))
+        if old is None:
+            continue
+        ratio = r["median_s"] / old["median_s"] if old["median_s"] else float("inf")
+        print(f"  {r['name']:<28} {str(r['params'] or ''):<40} {ratio:6.2f}x", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__.splitlines()[0])
+    parser.add_argument("--out", default="bench.json", help="write JSON results here (default: bench.json)")
+    parser.add_argument("--rpc-url", help="benchmark against this node (e.g. a local Anvil) instead of in-process eth-tester")
+    parser.add_argument("--sync", action="store_true", help="use the sync Web3 client on a thread pool")
+    parser.add_argument("--only", nargs="+", default=[], choices=["derive", "storage", "history", "send", "tokens"])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--quick", action="store_true", help="skip the 10k-block and 100k-user sizes")
+    parser.add_argument("--txs-per-block", type=float, default=0.5, help="share of history blocks carrying a transfer")
+    parser.add_argument("--compare", metavar="JSON", help="print median ratios against an earlier results file")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(
+        args.rpc_url, not args.sync, args.only,
+        repeat=args.repeat, quick=args.quick, txs_per_block=args.txs_per_block,
+    ))
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "web3": version("web3"),
+            "backend": args.rpc_url or "eth-tester",
+            "async": not args.sync,
+        },
+        "results": results,
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+        f.write("\n")
+    print(f"Wrote {len(results)} results to {args.out}", file=sys.stderr)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(json.load(f), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import random
+import sys
+from typing import List, Optional
+
+from web3 import AsyncHTTPProvider, AsyncWeb3, HTTPProvider, Web3
+
+from bot.wallet import WalletManager
+
+from .token import TOKEN_ABI, TOKEN_BYTECODE
+
+# Anvil's default mnemonic and first dev key; eth-tester brings its own funded keys.
+MNEMONIC = "test test test test test test test test test test test junk"
+ANVIL_KEY = "0xac0974bec39a17e36ba4a6b4d238ff944bacb478cbed5efcae784d7bf4f2ff80"
+
+
+class LocalChain:
+    """A throwaway chain for benchmarks: in-process eth-tester (py-evm) or an Anvil URL.
+
+    ``wallet`` is a WalletManager whose faucet account is a pre-funded dev key.
+    """
+
+    def __init__(self, rpc_url: Optional[str] = None, use_async: bool = True):
+        self.rpc_url = rpc_url
+        if rpc_url:
+            self.w3 = AsyncWeb3(AsyncHTTPProvider(rpc_url)) if use_async else Web3(HTTPProvider(rpc_url))
+            self.tester = None
+            faucet_key = ANVIL_KEY
+        else:
+            # Imported here so an Anvil run does not need eth-tester installed.
+            from web3 import EthereumTesterProvider
+            from web3.providers.eth_tester import AsyncEthereumTesterProvider
+
+            provider = AsyncEthereumTesterProvider() if use_async else EthereumTesterProvider()
+            self.w3 = AsyncWeb3(provider) if use_async else Web3(provider)
+            self.tester = provider.ethereum_tester
+            faucet_key = self.tester.backend.account_keys[0].to_hex()
+        self.faucet_key = faucet_key
+        self.wallet: Optional[WalletManager] = None
+
+    @property
+    def backend(self) -> str:
+        return self.rpc_url or "eth-tester"
+
+    async def setup(self) -> WalletManager:
+        chain_id = await self.w3.eth.chain_id if isinstance(self.w3, AsyncWeb3) else self.w3.eth.chain_id
+        self.wallet = WalletManager(self.w3, MNEMONIC, chain_id, faucet_pk=self.faucet_key)
+        return self.wallet
+
+    async def mine(self, count: int):
+        if count <= 0:
+            return
+        if self.tester is not None:
+            await self.wallet.run_sync(self.tester.mine_blocks, count)
+        else:
+            await self.wallet.rpc(self.w3.provider.make_request, "anvil_mine", [hex(count)])
+
+    async def fund(self, addresses: List[str], wei: int = 10**20):
+        for address in addresses:
+            await self.wallet.faucet(address, wei)
+
+    async def grow_history(self, blocks: int, txs_per_block: float, recipients: List[str], seed: int = 1):
+        """Extends the chain by ``blocks`` blocks, about ``txs_per_block`` of which carry a transfer.
+
+        Dev chains automine one transaction per block, so density is at most 1.
+        """
+        rng = random.Random(seed)
+        empty = 0
+        for n in range(blocks):
+            if rng.random() < txs_per_block:
+                await self.mine(empty)
+                empty = 0
+                await self.wallet.faucet(rng.choice(recipients), 1)
+            else:
+                empty += 1
+            if n and n % 1000 == 0:
+                print(f"  ... {n}/{blocks} blocks", file=sys.stderr)
+        await self.mine(empty)
+
+    async def deploy_token(self, symbol: str = "BENCH", decimals: int = 6, supply: int = 10**30) -> str:
+        wallet = self.wallet
+        contract = wallet.w3.eth.contract(abi=TOKEN_ABI, bytecode=TOKEN_BYTECODE)
+        data = contract.constructor(symbol, decimals, supply).data_in_transaction
+        acct = wallet.faucet_account
+        tx = await wallet.build_tx(acct.address, None, 0, data=bytes.fromhex(data[2:]))
+        tx_hash = await wallet.sign_and_send(acct, tx)
+        receipt = await wallet.rpc(wallet.w3.eth.wait_for_transaction_receipt, tx_hash)
+        return receipt["contractAddress"]
+
+    async def close(self):
+        if self.wallet is not None:
+            await self.wallet.close()
@@ -0,0 +1,403 @@
+"""Offline load test: synthetic Telegram users driving the Application built by run.py.
+
+    python -m benchmarks.load --users 200 --duration 30
+    python -m benchmarks.load --mix balance=1,send=1 --think 0.5 --out load.json
+    python -m benchmarks.load --rpc-url http://127.0.0.1:8545 --users 500
+
+Each virtual user sends an update, waits for the bot's reply, and repeats
+with scenarios drawn from --mix. Updates go through the real handlers,
+conversation states, admission control and update processor; Bot API calls
+are answered in-process by a stub transport, and the chain is in-process
+eth-tester unless --rpc-url points at a local node. Bot settings are read
+from the environment as usual (no .env), so e.g. ADMISSION_RATE=100 or
+STORAGE_BACKEND=sqlite apply to the run.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import math
+import os
+import platform
+import queue
+import random
+import re
+import sys
+import tempfile
+import time
+from importlib.metadata import version
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from telegram.request import BaseRequest, RequestData
+
+from bot.config import config
+
+# Nothing here may import bot.storage at module level: it resolves
+# ./nuclear-codes when imported, and main() first moves to a temp directory.
+from .chain import MNEMONIC, LocalChain
+
+SCENARIOS = ("balance", "send", "history", "token")
+TOKEN_SYMBOL = "LOAD"
+# ReceiptTracker notifications arrive on their own, not as a reply to a step.
+NOTIFICATION = re.compile(r"^\S+ Tx 0x[0-9a-fA-F]{64} ")
+# A /history block scan (no indexer) posts this first, edits it, then replies with the result.
+HISTORY_PROGRESS = "Scanning "
+ERROR_PREFIXES = ("❌", "⛔")
+REJECTED_PREFIX = "⏳"
+
+
+class StubRequest(BaseRequest):
+    """Answers Bot API calls locally and hands every message the bot sends or edits to ``on_message(chat_id, text, method)``.
+
+    ``latency`` seconds are added to each call to stand in for the round
+    trip to Telegram.
+    """
+
+    def __init__(self, on_message, latency: float = 0.0):
+        self.on_message = on_message
+        self.latency = latency
+        self.calls: Dict[str, int] = {}
+        self._message_id = 0
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return None
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def _message(self, chat_id: int, text: str, **extra: Any) -> Dict[str, Any]:
+        self._message_id += 1
+        return {"message_id": self._message_id, "date": int(time.time()), "chat": {"id": chat_id, "type": "private"}, "text": text, **extra}
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None, read_timeout=None, write_timeout=None, connect_timeout=None, pool_timeout=None) -> Tuple[int, bytes]:
+        name = url.rsplit("/", 1)[-1]
+        self.calls[name] = self.calls.get(name, 0) + 1
+        params = request_data.parameters if request_data is not None else {}
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        result: Any = True
+        if name == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "ETM", "username": "etm_load_bot"}
+        elif name in ("sendMessage", "editMessageText"):
+            chat_id = int(params.get("chat_id", 0))
+            result = self._message(chat_id, str(params.get("text", "")))
+            self.on_message(chat_id, result["text"], name)
+        elif name == "sendDocument":
+            chat_id = int(params.get("chat_id", 0))
+            caption = str(params.get("caption", ""))
+            result = self._message(chat_id, caption, document={"file_id": "load", "file_unique_id": "load"})
+            self.on_message(chat_id, caption, name)
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+def text_update(update_id: int, user_id: int, text: str) -> Dict[str, Any]:
+    """The JSON Telegram would send for a private text message."""
+    message: Dict[str, Any] = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": f"load{user_id}"},
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": update_id, "message": message}
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile of sorted values."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, math.ceil(q / 100 * len(values)) - 1))]
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"unknown scenario {name!r} (choose from {', '.join(SCENARIOS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class StepStats:
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.ok = 0
+        self.rejected = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.samples: List[str] = []
+
+    def record(self, latency: float, outcome: str, text: str = ""):
+        self.latencies.append(latency)
+        if outcome == "ok":
+            self.ok += 1
+            return
+        setattr(self, outcome, getattr(self, outcome) + 1)
+        if len(self.samples) < 3 and text[:80] not in self.samples:
+            self.samples.append(text[:80])
+
+    def summary(self, name: str) -> Dict[str, Any]:
+        values = sorted(self.latencies)
+        total = len(values)
+        return {
+            "name": name,
+            "count": total,
+            "ok": self.ok,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "error_rate": (total - self.ok) / total if total else 0.0,
+            "p50_s": percentile(values, 50),
+            "p90_s": percentile(values, 90),
+            "p99_s": percentile(values, 99),
+            "max_s": values[-1] if values else 0.0,
+            "samples": self.samples,
+        }
+
+
+class LoadTest:
+    """Closed-loop virtual users against one in-process Application."""
+
+    def __init__(self, users: int, duration: float, mix: Dict[str, float], think: float = 0.0, timeout: float = 30.0, api_latency: float = 0.0, seed: int = 1):
+        self.users = users
+        self.duration = duration
+        self.mix = mix
+        self.think = think
+        self.timeout = timeout
+        self.rng = random.Random(seed)
+        self.request = StubRequest(self._on_message, api_latency)
+        self.inbox: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue()
+        self.stats: Dict[str, StepStats] = {}
+        self.scenarios = 0
+        self.notifications = 0
+        self.unexpected = 0
+        self._waiting: Dict[int, Tuple[asyncio.Future, str]] = {}
+        self._update_id = 0
+        self.sink: Optional[str] = None
+
+    def _on_message(self, chat_id: int, text: str, method: str):
+        if method == "editMessageText":
+            # Progress updates to a message already counted.
+            return
+        if NOTIFICATION.match(text):
+            self.notifications += 1
+            return
+        waiting = self._waiting.get(chat_id)
+        if waiting is None or waiting[0].done():
+            self.unexpected += 1
+            return
+        waiter, progress = waiting
+        if progress and text.startswith(progress):
+            return
+        del self._waiting[chat_id]
+        waiter.set_result(text)
+
+    async def step(self, name: str, user_id: int, text: str, expect: str = "", progress: str = "") -> bool:
+        """Sends one message as user_id and waits for the reply; True if it looks successful.
+
+        Messages starting with ``progress`` come before the reply and are skipped.
+        """
+        self._update_id += 1
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiting[user_id] = (waiter, progress)
+        started = time.perf_counter()
+        self.inbox.put(text_update(self._update_id, user_id, text))
+        stats = self.stats.setdefault(name, StepStats())
+        try:
+            reply = await asyncio.wait_for(waiter, self.timeout)
+        except asyncio.TimeoutError:
+            self._waiting.pop(user_id, None)
+            stats.record(time.perf_counter() - started, "timeouts", "(no reply)")
+            return False
+        latency = time.perf_counter() - started
+        if reply.startswith(REJECTED_PREFIX):
+            stats.record(latency, "rejected", reply)
+            return False
+        if reply.startswith(ERROR_PREFIXES) or not reply.startswith(expect):
+            stats.record(latency, "errors", reply)
+            return False
+        stats.record(latency, "ok")
+        return True
+
+    async def scenario(self, name: str, user_id: int):
+        if name == "balance":
+            await self.step("balance", user_id, "/balance", "Balance of")
+        elif name == "history":
+            await self.step("history", user_id, "/history", progress=HISTORY_PROGRESS)
+        elif name == "token":
+            await self.step("token_balance", user_id, f"/token_balance {TOKEN_SYMBOL}", f"{TOKEN_SYMBOL} balance:")
+        elif name == "send":
+            if not await self.step("send.start", user_id, "/send", "Enter destination"):
+                return
+            if not await self.step("send.to", user_id, self.sink, "Enter amount"):
+                return
+            await self.step("send.amount", user_id, "0.0001", "✅ Sent")
+
+    async def user(self, user_id: int, deadline: float):
+        names, weights = list(self.mix), list(self.mix.values())
+        # Spread the first requests over a second instead of one burst.
+        await asyncio.sleep(self.rng.random())
+        while time.monotonic() < deadline:
+            await self.scenario(self.rng.choices(names, weights)[0], user_id)
+            self.scenarios += 1
+            if self.think:
+                await asyncio.sleep(self.rng.expovariate(1 / self.think))
+
+    async def prepare(self, chain: LocalChain, workdir: str):
+        """Funds every user's derived account and registers a token in every chat, before the bot starts."""
+        from bot.storage import atomic_write_json
+
+        wallet = chain.wallet
+        user_ids = list(range(1, self.users + 1))
+        users = {str(uid): uid - 1 for uid in user_ids}
+        print(f"Funding {self.users} users and deploying {TOKEN_SYMBOL} ...", file=sys.stderr)
+        await chain.fund([a.address for a in wallet.derive_many(users.values())], 10**19)
+        token = await chain.deploy_token(TOKEN_SYMBOL)
+        self.sink = wallet.derive_account(10**6).address
+        tokens = {str(uid): {TOKEN_SYMBOL: {"address": token, "decimals": 6, "symbol": TOKEN_SYMBOL}} for uid in user_ids}
+        base = Path(workdir) / "nuclear-codes"
+        base.mkdir(parents=True, exist_ok=True)
+        atomic_write_json(base / "users.json", users)
+        atomic_write_json(base / "tokens.json", tokens)
+        config.WHITELIST = frozenset(user_ids)
+        config.WALLET_MNEMONIC = MNEMONIC
+        config.CHAIN_ID = wallet.chain_id
+        config.BOT_TOKEN = "1:load"
+        config.BOT_MODE = "polling"
+        # The harness wallet already uses the dev key; a second nonce manager on it would collide.
+        config.FAUCET_PRIVATE_KEY = ""
+        config.WORKERS = 1
+
+    async def run(self, chain: LocalChain) -> Dict[str, Any]:
+        # run.py imports bot.storage lazily, so nuclear-codes/ resolves inside the working directory set by main().
+        import run as bot_run
+        from bot.startup import StartupReport
+        from bot.workers import serve_updates
+
+        app, startup = bot_run.build_application(StartupReport(time.perf_counter()), w3=chain.w3, request=self.request)
+        serving = asyncio.create_task(serve_updates(app, self.inbox, startup))
+        while "error" not in startup and not (startup.get("task") and startup["task"].done()):
+            if serving.done():
+                await serving
+            await asyncio.sleep(0.05)
+        if "error" in startup:
+            self.inbox.put(None)
+            await serving
+            raise SystemExit(startup["error"])
+
+        print(f"Running {self.users} users for {self.duration:.0f}s, mix {self.mix} ...", file=sys.stderr)
+        started = time.perf_counter()
+        deadline = time.monotonic() + self.duration
+        await asyncio.gather(*(self.user(uid, deadline) for uid in range(1, self.users + 1)))
+        elapsed = time.perf_counter() - started
+        self.inbox.put(None)
+        await serving
+
+        steps = [self.stats[name].summary(name) for name in sorted(self.stats)]
+        everything = StepStats()
+        for s in self.stats.values():
+            everything.latencies.extend(s.latencies)
+            everything.ok += s.ok
+            everything.rejected += s.rejected
+            everything.errors += s.errors
+            everything.timeouts += s.timeouts
+        total = everything.summary("all")
+        total["samples"] = []
+        return {
+            "elapsed_s": elapsed,
+            "throughput_per_s": total["count"] / elapsed if elapsed else 0.0,
+            "scenarios_per_s": self.scenarios / elapsed if elapsed else 0.0,
+            "total": total,
+            "steps": steps,
+            "notifications": self.notifications,
+            "unexpected_messages": self.unexpected,
+            "bot_api_calls": dict(self.request.calls),
+        }
+
+
+def print_report(result: Dict[str, Any]):
+    out = sys.stderr
+    print(f"\n{result['total']['count']} replies in {result['elapsed_s']:.1f}s: {result['throughput_per_s']:.1f} replies/s, "
+          f"{result['scenarios_per_s']:.1f} scenarios/s, error rate {result['total']['error_rate']:.1%}", file=out)
+    print(f"{'step':<16}{'count':>8}{'ok':>8}{'busy':>7}{'err':>6}{'t/o':>5}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}", file=out)
+    for s in result["steps"] + [result["total"]]:
+        print(f"{s['name']:<16}{s['count']:>8}{s['ok']:>8}{s['rejected']:>7}{s['errors']:>6}{s['timeouts']:>5}"
+              f"{s['p50_s'] * 1000:>10.1f}{s['p90_s'] * 1000:>10.1f}{s['p99_s'] * 1000:>10.1f}{s['max_s'] * 1000:>10.1f}", file=out)
+    for s in result["steps"]:
+        for sample in s["samples"]:
+            print(f"  {s['name']}: {sample}", file=out)
+    print(f"Receipt notifications: {result['notifications']}; unexpected messages: {result['unexpected_messages']}", file=out)
+
+
+async def run_load(args: argparse.Namespace) -> Dict[str, Any]:
+    chain = LocalChain(args.rpc_url, use_async=True)
+    await chain.setup()
+    try:
+        test = LoadTest(args.users, args.duration, args.mix, think=args.think, timeout=args.timeout, api_latency=args.api_latency, seed=args.seed)
+        await test.prepare(chain, os.getcwd())
+        return await test.run(chain)
+    finally:
+        await chain.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.load", description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100, help="concurrent virtual users (default: 100)")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of load (default: 30)")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("balance=4,send=2,history=2,token=2"), help="scenario weights (default: balance=4,send=2,history=2,token=2)")
+    parser.add_argument("--think", type=float, default=1.0, help="mean pause between a user's scenarios in seconds (default: 1)")
+    parser.add_argument("--timeout", type=float, default=30, help="seconds to wait for a reply before counting a timeout")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="seconds added to every stubbed Bot API call")
+    parser.add_argument("--rpc-url", help="use this local node (e.g. Anvil) instead of in-process eth-tester")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", default="load.json", help="write JSON results here (default: load.json)")
+    args = parser.parse_args()
+    out = os.path.abspath(args.out)
+
+    with tempfile.TemporaryDirectory(prefix="etm-load-") as tmp:
+        cwd = os.getcwd()
+        # Storage and the tx index live under ./nuclear-codes; keep them out of the checkout.
+        os.chdir(tmp)
+        # For ``import run``; with -m, sys.path has "" (the directory we just left).
+        sys.path.insert(0, cwd)
+        try:
+            result = asyncio.run(run_load(args))
+        finally:
+            os.chdir(cwd)
+    print_report(result)
+    from .__main__ import git_commit
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "web3": version("web3"),
+            "telegram": version("python-telegram-bot"),
+            "backend": args.rpc_url or "eth-tester",
+            "users": args.users,
+            "duration_s": args.duration,
+            "mix": args.mix,
+            "think_s": args.think,
+            "api_latency_s": args.api_latency,
+        },
+        "result": result,
+    }
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+        f.write("\n")
+    print(f"Wrote {out}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+import asyncio
+import inspect
+import statistics
+import sys
+import tempfile
+import time
+import types
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from bot.config import config
+from bot.handlers import Handlers
+from bot.storage import JSONStorage, MemoryStorage
+from bot.wallet import HDDeriver
+
+from .chain import MNEMONIC, LocalChain
+
+Result = Dict[str, Any]
+
+
+async def measure(name: str, fn: Callable[[], Any], repeat: int, number: int = 1, **params: Any) -> Result:
+    """Times ``number`` calls of fn, ``repeat`` times; fn may be sync or async."""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            out = fn()
+            if inspect.isawaitable(out):
+                await out
+        samples.append((time.perf_counter() - started) / number)
+    median = statistics.median(samples)
+    result = {
+        "name": name,
+        "params": params,
+        "repeat": repeat,
+        "number": number,
+        "min_s": min(samples),
+        "median_s": median,
+        "mean_s": statistics.fmean(samples),
+        "max_s": max(samples),
+        "stdev_s": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        "ops_per_s": 1 / median if median else None,
+    }
+    print(f"{name:<28} {str(params or ''):<40} median {median * 1000:10.3f} ms", file=sys.stderr)
+    return result
+
+
+class _Message:
+    def __init__(self, text: str = ""):
+        self.text = text
+        self.replies: List[str] = []
+
+    async def reply_text(self, text: str, **kwargs):
+        self.replies.append(text)
+        return self
+
+    async def edit_text(self, text: str, **kwargs):
+        self.replies.append(text)
+        return self
+
+
+def fake_update(user_id: int, chat_id: int, text: str = ""):
+    """Just enough of telegram.Update for the handlers under test."""
+    message = _Message(text)
+    return types.SimpleNamespace(
+        effective_user=types.SimpleNamespace(id=user_id),
+        effective_chat=types.SimpleNamespace(id=chat_id),
+        message=message,
+        effective_message=message,
+    )
+
+
+def fake_context(*args: str):
+    return types.SimpleNamespace(args=list(args), user_data={}, chat_data={}, bot_data={})
+
+
+class Suite:
+    """The benchmark cases; each ``bench_*`` coroutine returns a list of results."""
+
+    def __init__(self, chain: LocalChain, workdir: Path, repeat: int = 5, quick: bool = False, txs_per_block: float = 0.5):
+        self.chain = chain
+        self.workdir = workdir
+        self.repeat = repeat
+        self.txs_per_block = txs_per_block
+        self.history_sizes = [100, 1000] if quick else [100, 1000, 10000]
+        self.user_counts = [10, 1000] if quick else [10, 1000, 100000]
+        # The handlers check WHITELIST; benchmarks use made-up users.
+        config.WHITELIST = frozenset()
+        # /history caps its range; the largest case must really scan that many blocks.
+        config.HISTORY_MAX_BLOCKS = max(config.HISTORY_MAX_BLOCKS, *self.history_sizes)
+
+    @property
+    def wallet(self):
+        return self.chain.wallet
+
+    def _storage(self, name: str) -> MemoryStorage:
+        return MemoryStorage(self.workdir / f"{name}-users.json", self.workdir / f"{name}-tokens.json", flush_interval=60)
+
+    async def bench_derive(self) -> List[Result]:
+        cold = HDDeriver(MNEMONIC, cache_size=0)
+        counter = iter(range(10**9))
+        results = [await measure("derive_account.uncached", lambda: cold.derive(next(counter)), self.repeat, number=100)]
+        self.wallet.derive_many(range(100))
+        results.append(await measure("derive_account.cached", lambda: self.wallet.derive_account(next(counter) % 100), self.repeat, number=1000))
+        return results
+
+    async def bench_storage(self) -> List[Result]:
+        results = []
+        for users in self.user_counts:
+            path = self.workdir / f"json-{users}-users.json"
+            json_storage = JSONStorage(path, self.workdir / f"json-{users}-tokens.json")
+            json_storage.save_users({str(i): i for i in range(users)})
+
+            def cycle():
+                data = json_storage.get_users()
+                data[str(len(data))] = len(data)
+                json_storage.save_users(data)
+
+            repeat = self.repeat if users < 100000 else min(self.repeat, 3)
+            results.append(await measure("json_storage.get_save", cycle, repeat, users=users))
+            new_users = iter(range(users + 10**6, 10**9))
+            results.append(await measure("json_storage.assign_index", lambda: json_storage.get_or_assign_index(next(new_users)), repeat, users=users))
+
+            memory = MemoryStorage(path, self.workdir / f"json-{users}-tokens.json", flush_interval=60)
+            results.append(await measure("memory_storage.assign_index", lambda: memory.get_or_assign_index(next(new_users)), self.repeat, number=100, users=users))
+            memory.close()
+        return results
+
+    async def bench_history(self) -> List[Result]:
+        # Background traffic goes to accounts other than the bench user's, so
+        # /history scans the whole range instead of stopping at 20 hits.
+        recipients = [a.address for a in self.wallet.derive_many(range(100, 150))]
+        have = await self.wallet.block_number()
+        need = max(self.history_sizes) - have
+        if need > 0:
+            print(f"Building {need} blocks at {self.txs_per_block} tx/block ...", file=sys.stderr)
+            await self.chain.grow_history(need, self.txs_per_block, recipients)
+        handlers = Handlers(self.wallet, self._storage("history"))
+        results = []
+        for blocks in self.history_sizes:
+            results.append(await measure(
+                "handlers.history", lambda: handlers.history(fake_update(1, 1), fake_context(str(blocks))),
+                self.repeat, blocks=blocks, txs_per_block=self.txs_per_block,
+            ))
+        return results
+
+    async def bench_send(self) -> List[Result]:
+        acct = self.wallet.derive_account(500)
+        to = self.wallet.derive_account(501).address
+        await self.chain.fund([acct.address])
+        results = [await measure("send_eth.sequential", lambda: self.wallet.send_eth(acct, to, 1), self.repeat, number=20)]
+
+        if self.chain.tester is None:
+            # eth-tester mines on arrival and rejects nonces that arrive out of
+            # order, so concurrent sends only make sense against a real node.
+            async def burst():
+                await asyncio.gather(*(self.wallet.send_eth(acct, to, 1) for _ in range(20)))
+
+            results.append(await measure("send_eth.burst20", burst, self.repeat))
+        return results
+
+    async def bench_tokens(self) -> List[Result]:
+        token = await self.chain.deploy_token()
+        storage = self._storage("tokens")
+        handlers = Handlers(self.wallet, storage)
+        holder = await self.wallet.account(storage.get_or_assign_index(2))
+        storage.set_chat_token(2, "BENCH", {"address": token, "decimals": None})
+        results = [await measure("tokens.balance_of", lambda: handlers.tokens.balance_of(token, holder.address), self.repeat, number=50)]
+        results.append(await measure(
+            "handlers.token_balance", lambda: handlers.token_balance(fake_update(2, 2), fake_context("BENCH")),
+            self.repeat, number=50,
+        ))
+        return results
+
+    def cases(self) -> Dict[str, Callable[[], Awaitable[List[Result]]]]:
+        # History runs before the send benchmarks so the chain head is bench traffic free.
+        return {
+            "derive": self.bench_derive,
+            "storage": self.bench_storage,
+            "history": self.bench_history,
+            "send": self.bench_send,
+            "tokens": self.bench_tokens,
+        }
+
+
+async def run(rpc_url: Optional[str], use_async: bool, only: List[str], **kwargs: Any) -> List[Result]:
+    chain = LocalChain(rpc_url, use_async=use_async)
+    await chain.setup()
+    results: List[Result] = []
+    try:
+        with tempfile.TemporaryDirectory(prefix="etm-bench-") as tmp:
+            suite = Suite(chain, Path(tmp), **kwargs)
+            for name, case in suite.cases().items():
+                if only and name not in only:
+                    continue
+                results.extend(await case())
+    finally:
+        await chain.close()
+    return results
@@ -0,0 +1,33 @@
+# Minimal ERC-20 compiled from contracts/Token.vy (vyper 0.4.3, --evm-version shanghai).
+# Constructor: (symbol: string, decimals: uint8, supply: uint256); the deployer holds the supply.
+
+TOKEN_ABI = [
+    {"name": "Transfer", "inputs": [{"name": "sender", "type": "address", "indexed": True}, {"name": "receiver", "type": "address", "indexed": True}, {"name": "value", "type": "uint256", "indexed": False}], "anonymous": False, "type": "event"},
+    {"stateMutability": "nonpayable", "type": "function", "name": "transfer", "inputs": [{"name": "_to", "type": "address"}, {"name": "_value", "type": "uint256"}], "outputs": [{"name": "", "type": "bool"}]},
+    {"stateMutability": "view", "type": "function", "name": "name", "inputs": [], "outputs": [{"name": "", "type": "string"}]},
+    {"stateMutability": "view", "type": "function", "name": "symbol", "inputs": [], "outputs": [{"name": "", "type": "string"}]},
+    {"stateMutability": "view", "type": "function", "name": "decimals", "inputs": [], "outputs": [{"name": "", "type": "uint8"}]},
+    {"stateMutability": "view", "type": "function", "name": "totalSupply", "inputs": [], "outputs": [{"name": "", "type": "uint256"}]},
+    {"stateMutability": "view", "type": "function", "name": "balanceOf", "inputs": [{"name": "arg0", "type": "address"}], "outputs": [{"name": "", "type": "uint256"}]},
+    {"stateMutability": "nonpayable", "type": "constructor", "inputs": [{"name": "_symbol", "type": "string"}, {"name": "_decimals", "type": "uint8"}, {"name": "_supply", "type": "uint256"}], "outputs": []},
+]
+
+TOKEN_BYTECODE = (
+    "0x"
+    "346100c25760206102dd5f395f516020816102dd015f395f51602081116100c257506040816102dd0160403950602061"
+    "02fd5f395f518060081c6100c25760805260405160015560605160025560405160035560605160045560805160055560"
+    "2061031d5f395f51600655602061031d5f395f516007336020525f5260405f2055335f7fddf252ad1be2c89b69c2b068"
+    "fc378daa952ba7f163c4a11628f55a4df523b3ef602061031d60a039602060a0a36101e16100c6610000396101e16100"
+    "00f35b5f80fd5f3560e01c60026005820660011b6101d701601e395f51565b63a9059cbb81186101cf57604436103417"
+    "6101d3576004358060a01c6101d3576040526007336020525f5260405f2080546024358082038281116101d357905090"
+    "5081555060076040516020525f5260405f2080546024358082018281106101d35790509050815550604051337fddf252"
+    "ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef60243560605260206060a36001606052602060"
+    "60f35b6306fdde0381186101cf57346101d3576020806040528060400160015481526002546020820152805180602083"
+    "0101601f825f03163682375050601f19601f825160200101169050810190506040f35b6395d89b41811861015c573461"
+    "01d35760208060405280604001600354815260045460208201528051806020830101601f825f03163682375050601f19"
+    "601f825160200101169050810190506040f35b6318160ddd81186101cf57346101d35760065460405260206040f35b63"
+    "313ce567811861019457346101d35760055460405260206040f35b6370a0823181186101cf576024361034176101d357"
+    "6004358060a01c6101d35760405260076040516020525f5260405f205460605260206060f35b5f5ffd5b5f80fd010c01"
+    "78001801cf00bc855820eff0e16d79f0cb14568b41a18db2a48bf9b09cab37b3b7d1ea068bbc9fc967ef1901e1810a00"
+    "a1657679706572830004030036"
+)
@@ -0,0 +1,171 @@
+import asyncio
+import functools
+import heapq
+import itertools
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# Lower runs first when the global limit is saturated.
+PRIORITY_SEND = 0
+PRIORITY_TOKEN = 1
+PRIORITY_FAUCET = 1
+PRIORITY_HISTORY = 2
+
+
+class Rejected(Exception):
+    """Raised instead of queueing; the message is shown to the user."""
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, cost: float = 1.0) -> float:
+        """Takes cost tokens and returns 0, or returns the seconds until they would be available."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+
+class PrioritySemaphore:
+    """asyncio semaphore whose waiters are woken lowest priority value first, FIFO within a priority."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, fut in self._waiters if not fut.done())
+
+    async def acquire(self, priority: int):
+        if self.active < self.limit and not self.waiting:
+            self.active += 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # Woken and cancelled in the same tick; pass the slot on.
+                self.release()
+            raise
+
+    def release(self):
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                # The slot moves straight to the waiter; active stays the same.
+                fut.set_result(None)
+                return
+        self.active -= 1
+
+
+class AdmissionController:
+    """Gates expensive handlers behind per-user and global limits.
+
+    Each user has a token bucket (``rate`` per second, up to ``burst``) and
+    may run ``per_user`` guarded commands at once. At most ``global_limit``
+    run concurrently overall; the rest wait by priority, and once
+    ``max_queue`` are waiting new requests are turned away with a message
+    rather than piling up. Handlers that are not wrapped are never queued.
+    """
+
+    def __init__(self, global_limit: int = 8, per_user: int = 2, rate: float = 1.0, burst: float = 5.0, max_queue: int = 100):
+        self.per_user = per_user
+        self.rate = rate
+        self.burst = burst
+        self.max_queue = max_queue
+        self._sem = PrioritySemaphore(global_limit)
+        self._buckets: Dict[int, TokenBucket] = {}
+        self._user_active: Dict[int, int] = {}
+        self.rejected = 0
+
+    def _bucket(self, user_id: int) -> TokenBucket:
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = self._buckets[user_id] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    def _admit(self, user_id: int, cost: float):
+        if self._user_active.get(user_id, 0) >= self.per_user:
+            raise Rejected("You already have requests running; wait for them to finish.")
+        if self._sem.waiting >= self.max_queue:
+            raise Rejected("The bot is busy right now; please try again in a moment.")
+        wait = self._bucket(user_id).take(cost)
+        if wait:
+            raise Rejected(f"Slow down: try again in {wait:.0f}s.")
+
+    async def run(self, user_id: int, fn: Callable[[], Awaitable[T]], priority: int = PRIORITY_HISTORY, cost: float = 1.0) -> T:
+        try:
+            self._admit(user_id, cost)
+        except Rejected:
+            self.rejected += 1
+            raise
+        self._user_active[user_id] = self._user_active.get(user_id, 0) + 1
+        try:
+            await self._sem.acquire(priority)
+            try:
+                return await fn()
+            finally:
+                self._sem.release()
+        finally:
+            self._user_active[user_id] -= 1
+            if not self._user_active[user_id]:
+                del self._user_active[user_id]
+
+    def wrap(self, callback: Callable[..., Awaitable[Any]], priority: int = PRIORITY_HISTORY, cost: float = 1.0, on_reject: Any = None) -> Callable[..., Awaitable[Any]]:
+        """Wraps a handler callback; rejected updates get a reply and return on_reject."""
+
+        @functools.wraps(callback)
+        async def wrapper(update, context):
+            user = update.effective_user
+            try:
+                return await self.run(user.id if user else 0, lambda: callback(update, context), priority, cost)
+            except Rejected as e:
+                if update.effective_message:
+                    await update.effective_message.reply_text(f"⏳ {e}")
+                return on_reject
+
+        return wrapper
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "running": self._sem.active,
+            "waiting": self._sem.waiting,
+            "users": len(self._user_active),
+            "rejected": self.rejected,
+        }
+
+
+class SingleFlight:
+    """Shares one in-flight computation between concurrent callers with the same key."""
+
+    def __init__(self):
+        self._flights: Dict[Hashable, asyncio.Future] = {}
+        self.shared = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        fut = self._flights.get(key)
+        if fut is not None:
+            self.shared += 1
+            # shield: one caller giving up must not cancel the others.
+            return await asyncio.shield(fut)
+        fut = self._flights[key] = asyncio.ensure_future(fn())
+        fut.add_done_callback(lambda f: self._flights.pop(key) if self._flights.get(key) is f else None)
+        return await asyncio.shield(fut)
+
+    def in_flight(self, key: Optional[Hashable] = None) -> int:
+        return len(self._flights) if key is None else int(key in self._flights)
@@ -0,0 +1,139 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from .metrics import metrics
+
+log = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class BlockCache:
+    """Read cache for chain state that only changes when a new block arrives.
+
+    Values are read at an explicit block number and stored under
+    (kind, key, block) in a bounded LRU. The head itself is trusted for up to
+    ``poll_interval`` seconds; ``run`` polls it twice as often so reads never
+    wait for it, and every entry is dropped when a new block shows up. Writes
+    made through the wallet call ``invalidate`` so a user's own send (or an
+    anvil_setBalance) is visible right away.
+    """
+
+    def __init__(self, wallet, max_entries: int = 10000, poll_interval: float = 1.0, report_interval: float = 300.0):
+        self.wallet = wallet
+        self.max_entries = max_entries
+        self.poll_interval = poll_interval
+        self.report_interval = report_interval
+        self.head: Optional[int] = None
+        self._head_at = 0.0
+        self._head_fetch: Optional[asyncio.Future] = None
+        # Bumped by invalidate(); reads that started earlier are not stored.
+        self._generation = 0
+        self._entries: "OrderedDict[Tuple[str, Hashable, int], Any]" = OrderedDict()
+        # kind -> [hits, misses], since start and since the last report
+        self.totals: Dict[str, List[int]] = {}
+        self._window: Dict[str, List[int]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def _count(self, kind: str, hit: bool):
+        for table in (self.totals, self._window):
+            table.setdefault(kind, [0, 0])[0 if hit else 1] += 1
+        if metrics.enabled:
+            metrics.cache_lookups.inc(kind, "hit" if hit else "miss")
+
+    async def _fetch_head(self) -> int:
+        generation = self._generation
+        head = await self.wallet.fetch_block_number()
+        if head != self.head:
+            self._entries.clear()
+            self.head = head
+        if generation == self._generation:
+            self._head_at = time.monotonic()
+        return head
+
+    def _head_fresh(self) -> bool:
+        return self.head is not None and time.monotonic() - self._head_at < self.poll_interval
+
+    async def _current_head(self) -> int:
+        if self._head_fresh():
+            return self.head
+        # Concurrent callers share one eth_blockNumber.
+        if self._head_fetch is None or self._head_fetch.done():
+            self._head_fetch = asyncio.ensure_future(self._fetch_head())
+        return await asyncio.shield(self._head_fetch)
+
+    async def block_number(self) -> int:
+        self._count("block_number", self._head_fresh())
+        return await self._current_head()
+
+    async def get(self, kind: str, key: Hashable, fetch: Callable[[int], Awaitable[Any]]) -> Any:
+        """Returns the cached value for key at the current head, or fetch(head) on a miss."""
+        block = await self._current_head()
+        entry = (kind, key, block)
+        value = self._entries.get(entry, _MISSING)
+        if value is not _MISSING:
+            self._entries.move_to_end(entry)
+            self._count(kind, True)
+            return value
+        self._count(kind, False)
+        generation = self._generation
+        value = await fetch(block)
+        # A new head or a local write while fetching makes this value stale.
+        if block == self.head and generation == self._generation and self.max_entries > 0:
+            self._entries[entry] = value
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self):
+        """Forgets every cached value and the head, e.g. after a local write."""
+        self._entries.clear()
+        self._head_at = 0.0
+        self._head_fetch = None
+        self._generation += 1
+
+    def hit_ratios(self, since_report: bool = False) -> Dict[str, float]:
+        table = self._window if since_report else self.totals
+        return {kind: hits / (hits + misses) for kind, (hits, misses) in table.items() if hits + misses}
+
+    def report(self):
+        if not self._window:
+            return
+        parts = [
+            f"{kind} {hits}/{hits + misses} ({hits / (hits + misses):.0%})"
+            for kind, (hits, misses) in sorted(self._window.items())
+        ]
+        saved = sum(hits for hits, _ in self._window.values())
+        log.warning("Block cache hits: %s; %d RPC calls saved, %d entries", ", ".join(parts), saved, len(self._entries))
+        self._window = {}
+
+    async def run(self):
+        last_report = time.monotonic()
+        while True:
+            try:
+                await self._fetch_head()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("Head poll failed")
+            if time.monotonic() - last_report >= self.report_interval:
+                self.report()
+                last_report = time.monotonic()
+            await asyncio.sleep(self.poll_interval / 2)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run(), name="block-cache")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.report()
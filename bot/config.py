@@ -1,25 +1,108 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field, fields
 import os
-from dotenv import load_dotenv
+from typing import Any, Callable
 
-load_dotenv()
+
+# Settings are read from the environment when a Config is created, not when
+# this module is imported; Config.load() pulls in .env first.
+def _env(name: str, default: str = "", parse: Callable[[str], Any] = str):
+    return field(default_factory=lambda: parse(os.getenv(name, default)))
+
+
+def _flag(name: str, default: str):
+    return _env(name, default, lambda v: v.strip().lower() in ("1", "true", "yes"))
+
+
+def _choice(name: str, default: str):
+    return _env(name, default, lambda v: v.strip().lower())
+
+
+def _rpc_urls() -> tuple[str, ...]:
+    return tuple(u.strip() for u in (os.getenv("RPC_URLS") or os.getenv("RPC_URL", "")).split(",") if u.strip())
 
 
 @dataclass
 class Config:
-    RPC_URL: str = os.getenv("RPC_URL", "")
-    BOT_TOKEN: str = os.getenv("BOT_TOKEN", "")
-    WALLET_MNEMONIC: str = os.getenv("WALLET_MNEMONIC", "")
-    GAS_PRICE_GWEI: str = os.getenv("GAS_PRICE_GWEI", "")
-    FAUCET_PRIVATE_KEY: str = os.getenv("FAUCET_PRIVATE_KEY", "")
+    RPC_URL: str = _env("RPC_URL", "")
+    RPC_URLS: tuple[str, ...] = field(default_factory=_rpc_urls)
+    RPC_POOL_SIZE: int = _env("RPC_POOL_SIZE", "32", int)
+    RPC_TIMEOUT: float = _env("RPC_TIMEOUT", "10", float)
+    RPC_HEALTH_INTERVAL: float = _env("RPC_HEALTH_INTERVAL", "5", float)
+    BOT_TOKEN: str = _env("BOT_TOKEN", "")
+    BOT_MODE: str = _choice("BOT_MODE", "polling")
+    WEBHOOK_URL: str = _env("WEBHOOK_URL", "")
+    WEBHOOK_LISTEN: str = _env("WEBHOOK_LISTEN", "127.0.0.1")
+    WEBHOOK_PORT: int = _env("WEBHOOK_PORT", "8443", int)
+    WEBHOOK_PATH: str = _env("WEBHOOK_PATH", "telegram")
+    WEBHOOK_SECRET: str = _env("WEBHOOK_SECRET", "")
+    WEBHOOK_MAX_CONNECTIONS: int = _env("WEBHOOK_MAX_CONNECTIONS", "40", int)
+    CONCURRENT_UPDATES: int = _env("CONCURRENT_UPDATES", "64", int)
+    WORKERS: int = _env("WORKERS", "1", int)
+    WALLET_MNEMONIC: str = _env("WALLET_MNEMONIC", "")
+    GAS_PRICE_GWEI: str = _env("GAS_PRICE_GWEI", "")
+    FAUCET_PRIVATE_KEY: str = _env("FAUCET_PRIVATE_KEY", "")
+    DERIVATION_CACHE_SIZE: int = _env("DERIVATION_CACHE_SIZE", "1024", int)
+    RPC_ASYNC: bool = _flag("RPC_ASYNC", "true")
+    RPC_EXECUTOR_WORKERS: int = _env("RPC_EXECUTOR_WORKERS", "8", int)
+    FAUCET_BATCH_WINDOW: float = _env("FAUCET_BATCH_WINDOW", "0.25", float)
+    FAUCET_MAX_BATCH: int = _env("FAUCET_MAX_BATCH", "50", int)
+    FAUCET_ANVIL_SET_BALANCE: bool = _flag("FAUCET_ANVIL_SET_BALANCE", "false")
+    FEE_MODE: str = _choice("FEE_MODE", "auto")
+    FEE_CACHE_SECONDS: float = _env("FEE_CACHE_SECONDS", "2", float)
+    MULTICALL_ADDRESS: str = _env("MULTICALL_ADDRESS", "", lambda v: v or "0xcA11bde05977b3631167028862bE2a173976CA11")
+    PORTFOLIO_MODE: str = _choice("PORTFOLIO_MODE", "multicall")
+    STORAGE_BACKEND: str = _choice("STORAGE_BACKEND", "memory")
+    STORAGE_FLUSH_SECONDS: float = _env("STORAGE_FLUSH_SECONDS", "1", float)
+    SCAN_BATCH_SIZE: int = _env("SCAN_BATCH_SIZE", "100", int)
+    SCAN_MAX_IN_FLIGHT: int = _env("SCAN_MAX_IN_FLIGHT", "4", int)
+    INDEXER_ENABLED: bool = _flag("INDEXER_ENABLED", "true")
+    INDEX_START_BLOCK: int = _env("INDEX_START_BLOCK", "0", int)
+    INDEX_POLL_SECONDS: float = _env("INDEX_POLL_SECONDS", "2", float)
+    HISTORY_PAGE_SIZE: int = _env("HISTORY_PAGE_SIZE", "20", int)
+    HISTORY_MAX_BLOCKS: int = _env("HISTORY_MAX_BLOCKS", "5000", int)
+    BLOCK_CACHE_ENABLED: bool = _flag("BLOCK_CACHE_ENABLED", "true")
+    BLOCK_CACHE_SIZE: int = _env("BLOCK_CACHE_SIZE", "10000", int)
+    HEAD_POLL_SECONDS: float = _env("HEAD_POLL_SECONDS", "1", float)
+    BLOCK_CACHE_REPORT_SECONDS: float = _env("BLOCK_CACHE_REPORT_SECONDS", "300", float)
+    TOKEN_HISTORY_MAX_BLOCKS: int = _env("TOKEN_HISTORY_MAX_BLOCKS", "100000", int)
+    LOGS_CHUNK_BLOCKS: int = _env("LOGS_CHUNK_BLOCKS", "2000", int)
+    LOGS_MAX_CHUNK_BLOCKS: int = _env("LOGS_MAX_CHUNK_BLOCKS", "100000", int)
+    LOGS_MAX_IN_FLIGHT: int = _env("LOGS_MAX_IN_FLIGHT", "4", int)
+    RECEIPTS_ENABLED: bool = _flag("RECEIPTS_ENABLED", "true")
+    RECEIPTS_POLL_SECONDS: float = _env("RECEIPTS_POLL_SECONDS", "1", float)
+    RECEIPTS_DROP_AFTER_BLOCKS: int = _env("RECEIPTS_DROP_AFTER_BLOCKS", "50", int)
+    RECEIPTS_MAX_PENDING: int = _env("RECEIPTS_MAX_PENDING", "10000", int)
+    METRICS_ENABLED: bool = _flag("METRICS_ENABLED", "false")
+    METRICS_HOST: str = _env("METRICS_HOST", "127.0.0.1")
+    METRICS_PORT: int = _env("METRICS_PORT", "9108", int)
+    ADMISSION_GLOBAL_LIMIT: int = _env("ADMISSION_GLOBAL_LIMIT", "8", int)
+    ADMISSION_PER_USER: int = _env("ADMISSION_PER_USER", "2", int)
+    ADMISSION_RATE: float = _env("ADMISSION_RATE", "1", float)
+    ADMISSION_BURST: float = _env("ADMISSION_BURST", "5", float)
+    ADMISSION_MAX_QUEUE: int = _env("ADMISSION_MAX_QUEUE", "100", int)
+    BULK_WORKERS: int = _env("BULK_WORKERS", "0", int)
+    BULK_CHUNK_SIZE: int = _env("BULK_CHUNK_SIZE", "200", int)
+    BULK_MAX_ROWS: int = _env("BULK_MAX_ROWS", "10000", int)
+    BULK_MAX_BYTES: int = _env("BULK_MAX_BYTES", str(5 * 1024 * 1024), int)
+    BATCH_MAX_ROWS: int = _env("BATCH_MAX_ROWS", "1000", int)
+    BATCH_MAX_IN_FLIGHT: int = _env("BATCH_MAX_IN_FLIGHT", "16", int)
+    RECOVER_CACHE_SIZE: int = _env("RECOVER_CACHE_SIZE", "100000", int)
+
+    CHAIN_ID: int | None = _env("CHAIN_ID", "", lambda v: int(v) if v.isdigit() else None)
+
+    WHITELIST: set[int] = _env("WHITELIST", "", lambda v: frozenset(
+        int(x.strip()) for x in v.split(",") if x.strip().isdigit()
+    ))
 
-    _chain_id = os.getenv("CHAIN_ID")
-    CHAIN_ID: int | None = int(_chain_id) if _chain_id and _chain_id.isdigit() else None
+    def load(self) -> "Config":
+        """Reads .env into the environment and re-reads every setting from it."""
+        from dotenv import load_dotenv
 
-    _whitelist = os.getenv("WHITELIST", "")
-    WHITELIST: set[int] = frozenset(
-        int(x.strip()) for x in _whitelist.split(",") if x.strip().isdigit()
-    )
+        load_dotenv()
+        fresh = Config()
+        for f in fields(self):
+            setattr(self, f.name, getattr(fresh, f.name))
+        return self
 
     def validate(self):
         missing = []
@@ -28,16 +111,18 @@ class Config:
             missing.append("BOT_TOKEN")
         if not self.WALLET_MNEMONIC:
             missing.append("WALLET_MNEMONIC")
-        if not self.RPC_URL:
+        if not self.RPC_URLS:
             missing.append("RPC_URL")
         if not self.WHITELIST:
             missing.append("WHITELIST")
         if not self.CHAIN_ID:
             missing.append("CHAIN_ID")
+        if self.BOT_MODE == "webhook" and not self.WEBHOOK_URL:
+            missing.append("WEBHOOK_URL")
 
         if missing:
             print(f"[WARNING] Missing in .env: {', '.join(missing)}")
 
 
+# Environment only until run.py calls config.load().
 config = Config()
-config.validate()
@@ -0,0 +1,197 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from web3 import Web3
+
+from .nonces import is_already_known, is_nonce_error
+from .wallet import WalletManager, raw_transaction
+
+log = logging.getLogger(__name__)
+
+SET_BALANCE = "anvil_setBalance"
+
+
+@dataclass
+class _Drip:
+    to: str
+    amount_wei: int
+    waiters: List[asyncio.Future] = field(default_factory=list)
+
+
+class FaucetDispenser:
+    """Queues faucet drips and sends them in batches from the faucet account.
+
+    Requests for the same address that arrive within ``window`` seconds are
+    merged into one drip of the largest requested amount. Each batch gets
+    consecutive nonces, is signed on the wallet's thread pool and broadcast
+    concurrently. On Anvil, ``use_set_balance`` tops balances up with
+    ``anvil_setBalance`` instead of sending transactions.
+    """
+
+    def __init__(self, wallet: WalletManager, window: float = 0.25, max_batch: int = 50, use_set_balance: bool = False):
+        if wallet.faucet_account is None:
+            raise RuntimeError("Faucet not configured")
+        self.wallet = wallet
+        self.account = wallet.faucet_account
+        self.window = window
+        self.max_batch = max_batch
+        self.use_set_balance = use_set_balance
+        self._queue: Dict[str, _Drip] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.started_at = time.monotonic()
+        self.drips_sent = 0
+        self.batches_sent = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run(), name="faucet-dispenser")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for drip in self._queue.values():
+            for fut in drip.waiters:
+                fut.cancel()
+        self._queue.clear()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    def stats(self) -> Dict[str, float]:
+        elapsed = max(time.monotonic() - self.started_at, 1e-9)
+        return {
+            "drips": self.drips_sent,
+            "batches": self.batches_sent,
+            "drips_per_second": self.drips_sent / elapsed,
+            "queue_depth": self.queue_depth,
+        }
+
+    async def drip(self, to: str, amount_wei: int) -> str:
+        """Queues a drip and waits for its tx hash (or "anvil_setBalance")."""
+        to = Web3.to_checksum_address(to)
+        fut = asyncio.get_running_loop().create_future()
+        pending = self._queue.get(to)
+        if pending is None:
+            pending = self._queue[to] = _Drip(to, amount_wei)
+        else:
+            pending.amount_wei = max(pending.amount_wei, amount_wei)
+        pending.waiters.append(fut)
+        self._wakeup.set()
+        self.start()
+        return await fut
+
+    async def run(self):
+        while True:
+            await self._wakeup.wait()
+            # Let duplicates and other requests pile up for one window.
+            await asyncio.sleep(self.window)
+            batch = [self._queue.pop(addr) for addr in list(self._queue)[: self.max_batch]]
+            if not self._queue:
+                self._wakeup.clear()
+            if batch:
+                try:
+                    await self._dispense(batch)
+                except Exception as e:
+                    log.exception("Faucet batch failed")
+                    for drip in batch:
+                        for fut in drip.waiters:
+                            if not fut.done():
+                                fut.set_exception(e)
+
+    async def _set_balances(self, batch: List[_Drip]):
+        provider = self.wallet.w3.provider
+
+        async def top_up(drip: _Drip):
+            wei = await self.wallet.rpc(self.wallet.w3.eth.get_balance, drip.to)
+            await self.wallet.rpc(provider.make_request, SET_BALANCE, [drip.to, hex(wei + drip.amount_wei)])
+            return SET_BALANCE
+
+        results = await asyncio.gather(*(top_up(d) for d in batch), return_exceptions=True)
+        # anvil_setBalance changes state without a new block.
+        self.wallet.state_changed()
+        self._resolve(batch, results)
+
+    async def _dispense(self, batch: List[_Drip]):
+        if self.use_set_balance and await self.wallet.is_anvil():
+            await self._set_balances(batch)
+            return
+        sender = self.account.address
+        fees = await self.wallet.fees.fee_fields()
+        txs = [{
+            "chainId": self.wallet.chain_id,
+            "from": sender,
+            "to": d.to,
+            "value": d.amount_wei,
+            "data": b"",
+            **fees,
+        } for d in batch]
+        gas = await asyncio.gather(*(self.wallet.fees.estimate_gas(tx) for tx in txs))
+        nonces = await self.wallet.nonces.reserve_many(sender, len(txs))
+        sent: Dict[int, str] = {}
+
+        async def broadcast(nonce: int, raw: bytes) -> str:
+            try:
+                tx_hash = (await self.wallet.rpc(self.wallet.w3.eth.send_raw_transaction, raw)).hex()
+            except Exception as e:
+                if not is_already_known(e):
+                    raise
+                # The node already holds this exact transaction.
+                tx_hash = Web3.keccak(raw).hex()
+            sent[nonce] = tx_hash
+            return tx_hash
+
+        try:
+            for tx, g, n in zip(txs, gas, nonces):
+                tx["gas"] = g
+                tx["nonce"] = n
+            signed = await self.wallet.run_sync(lambda: [self.account.sign_transaction(tx) for tx in txs])
+            results = await asyncio.gather(
+                *(broadcast(tx["nonce"], raw_transaction(s)) for tx, s in zip(txs, signed)),
+                return_exceptions=True,
+            )
+        except BaseException:
+            # Signing failed or the batch was cancelled: hand back the nonces that never went out.
+            for n in reversed(nonces):
+                if n not in sent:
+                    self.wallet.nonces.release(sender, n)
+            raise
+        self.wallet.state_changed()
+        for tx, res in zip(txs, results):
+            if not isinstance(res, Exception):
+                if self.wallet.receipts is not None:
+                    self.wallet.receipts.track(res, sender, tx["nonce"])
+            elif not is_nonce_error(res):
+                # Rejected outright. A nonce error means the nonce is taken; the resync below settles it.
+                self.wallet.nonces.release(sender, tx["nonce"])
+        if any(isinstance(r, Exception) and is_nonce_error(r) for r in results):
+            await self.wallet.nonces.resync(sender)
+        self._resolve(batch, results)
+
+    def _resolve(self, batch: List[_Drip], results: list):
+        ok = 0
+        for drip, res in zip(batch, results):
+            for fut in drip.waiters:
+                if fut.done():
+                    continue
+                if isinstance(res, Exception):
+                    fut.set_exception(res)
+                else:
+                    fut.set_result(res)
+            ok += not isinstance(res, Exception)
+        self.drips_sent += ok
+        self.batches_sent += 1
+        stats = self.stats()
+        log.info(
+            "Faucet batch: %d/%d drips ok, %.2f drips/s, queue depth %d",
+            ok, len(batch), stats["drips_per_second"], stats["queue_depth"],
+        )
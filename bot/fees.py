@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from web3 import Web3
+from web3.types import TxParams
+
+log = logging.getLogger(__name__)
+
+TRANSFER_GAS = 21000
+# Cached contract-call estimates may have been taken when a storage slot was
+# already set; leave room for one zero -> non-zero SSTORE on top.
+SSTORE_SET_GAS = 20000
+
+
+class FeeOracle:
+    """Caches fee data and gas estimates for WalletManager.build_tx.
+
+    Fee fields are refreshed at most once per ``ttl`` seconds and come from
+    ``eth_feeHistory`` (EIP-1559) when the chain reports a base fee, otherwise
+    from ``eth_gasPrice``. Value transfers to accounts without code use the
+    fixed 21000 gas, and contract calls reuse the largest estimate seen for
+    the same (contract, selector).
+    """
+
+    def __init__(self, wallet, ttl: float = 2.0, mode: str = "auto", fixed_gas_price_wei: Optional[int] = None, min_priority_fee_wei: int = 10**9, reward_percentile: int = 50, estimate_ttl: float = 300.0, cache_size: int = 4096):
+        self.wallet = wallet
+        self.ttl = ttl
+        self.mode = mode
+        self.fixed_gas_price_wei = fixed_gas_price_wei
+        self.min_priority_fee_wei = min_priority_fee_wei
+        self.reward_percentile = reward_percentile
+        self.estimate_ttl = estimate_ttl
+        self.cache_size = cache_size
+        self._fees: Optional[Dict[str, int]] = None
+        self._fees_at = 0.0
+        self._fees_lock = asyncio.Lock()
+        self._estimates: "OrderedDict[Tuple[str, bytes], Tuple[int, float]]" = OrderedDict()
+        self._has_code: "OrderedDict[str, bool]" = OrderedDict()
+
+    def _remember(self, cache: OrderedDict, key, value):
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > self.cache_size:
+            cache.popitem(last=False)
+
+    async def _gas_price(self) -> int:
+        w3 = self.wallet.w3
+        if self.wallet.is_async:
+            return await w3.eth.gas_price
+        return await self.wallet.run_sync(lambda: w3.eth.gas_price)
+
+    async def _eip1559_fees(self) -> Optional[Dict[str, int]]:
+        w3 = self.wallet.w3
+        history = await self.wallet.rpc(w3.eth.fee_history, 1, "latest", [self.reward_percentile])
+        base_fees = history.get("baseFeePerGas") or []
+        if base_fees:
+            # The last entry is the base fee of the next block.
+            base_fee = base_fees[-1]
+            rewards = history.get("reward") or []
+            tip = rewards[-1][0] if rewards and rewards[-1] else 0
+        else:
+            block = await self.wallet.get_block("latest")
+            base_fee = block.get("baseFeePerGas")
+            tip = 0
+            if base_fee is None:
+                return None
+        tip = max(tip, self.min_priority_fee_wei)
+        # 2x base fee survives six consecutive full blocks before the tx is priced out.
+        return {"maxFeePerGas": 2 * base_fee + tip, "maxPriorityFeePerGas": tip}
+
+    async def _fetch_fees(self) -> Dict[str, int]:
+        if self.fixed_gas_price_wei is not None:
+            return {"gasPrice": self.fixed_gas_price_wei}
+        if self.mode != "legacy":
+            try:
+                fees = await self._eip1559_fees()
+                if fees is not None:
+                    return fees
+            except Exception as e:
+                log.info("eth_feeHistory unavailable (%s); using legacy gas price", e)
+                self.mode = "legacy"
+        return {"gasPrice": await self._gas_price()}
+
+    async def fee_fields(self) -> Dict[str, int]:
+        """Returns either {"gasPrice"} or {"maxFeePerGas", "maxPriorityFeePerGas"}."""
+        if self._fees is not None and time.monotonic() - self._fees_at < self.ttl:
+            return dict(self._fees)
+        async with self._fees_lock:
+            # Another coroutine may have refreshed while we waited.
+            if self._fees is None or time.monotonic() - self._fees_at >= self.ttl:
+                self._fees = await self._fetch_fees()
+                self._fees_at = time.monotonic()
+            return dict(self._fees)
+
+    async def gas_price(self) -> int:
+        fees = await self.fee_fields()
+        return fees.get("gasPrice") or fees["maxFeePerGas"]
+
+    async def _is_contract(self, address: str) -> bool:
+        has_code = self._has_code.get(address)
+        if has_code is None:
+            code = await self.wallet.rpc(self.wallet.w3.eth.get_code, address)
+            has_code = len(code) > 0
+            self._remember(self._has_code, address, has_code)
+        return has_code
+
+    async def estimate_gas(self, tx: TxParams) -> int:
+        to = tx.get("to")
+        data = Web3.to_bytes(hexstr=tx["data"]) if isinstance(tx.get("data"), str) else bytes(tx.get("data") or b"")
+        if to and not data and not await self._is_contract(to):
+            return TRANSFER_GAS
+        key = (to or "", data[:4]) if to and len(data) >= 4 else None
+        if key is not None:
+            hit = self._estimates.get(key)
+            if hit is not None and time.monotonic() - hit[1] < self.estimate_ttl:
+                return int(hit[0] * 1.2) + SSTORE_SET_GAS
+        estimate_dict: Dict[str, Any] = {k: v for k, v in tx.items() if v is not None}
+        gas_est = await self.wallet.rpc(self.wallet.w3.eth.estimate_gas, estimate_dict)
+        if key is not None:
+            prev = self._estimates.get(key)
+            self._remember(self._estimates, key, (max(gas_est, prev[0] if prev else 0), time.monotonic()))
+        return int(gas_est * 1.2)
@@ -1,3 +1,8 @@
+import asyncio
+import contextlib
+import csv
+import io
+import time
 from decimal import Decimal
 from typing import Dict, Any, Optional
 
@@ -13,17 +18,35 @@ from web3 import Web3
 
 from .wallet import WalletManager
 from .storage import JSONStorage
+from .indexer import TxIndexer
+from .faucet import FaucetDispenser, SET_BALANCE
+from .tokens import TokenMetadata, encode_transfer
+from .multicall import Multicall, PortfolioReader
+from .logs import LogScanner
+from .admission import SingleFlight
+from .payouts import BatchPayer, PAYOUT_HEADER, FAILED, parse_payouts
+from .signing import BulkSigner, SIGN_HEADER, VERIFY_HEADER, parse_messages, parse_verify_rows, to_csv
 from .config import config
 
 SEND_TO, SEND_AMOUNT = range(2)
 TSYMBOL, TTO, TAMOUNT = range(3)
 SIGN_MSG = 1
 VERIFY_AWAIT = 1
+BULK_FILE = 1
 
 class Handlers:
-    def __init__(self, wallet: WalletManager, storage: JSONStorage):
+    def __init__(self, wallet: WalletManager, storage: JSONStorage, indexer: Optional[TxIndexer] = None, faucet: Optional[FaucetDispenser] = None, multicall: Optional[Multicall] = None, signer: Optional[BulkSigner] = None):
         self.wallet = wallet
         self.storage = storage
+        self.indexer = indexer
+        self.dispenser = faucet
+        self.tokens = TokenMetadata(wallet, storage)
+        self.portfolio_reader = PortfolioReader(wallet, self.tokens, multicall, mode=config.PORTFOLIO_MODE)
+        self.logs = LogScanner(wallet, chunk_size=config.LOGS_CHUNK_BLOCKS, max_chunk=config.LOGS_MAX_CHUNK_BLOCKS, max_in_flight=config.LOGS_MAX_IN_FLIGHT)
+        # Identical concurrent scans and balance reads share one computation.
+        self.flights = SingleFlight()
+        self.signer = signer or BulkSigner(config.BULK_WORKERS or None, config.BULK_CHUNK_SIZE, config.RECOVER_CACHE_SIZE)
+        self.payer = BatchPayer(wallet, self.tokens, self.signer, max_in_flight=config.BATCH_MAX_IN_FLIGHT)
 
     async def check_whitelist(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
         if not config.WHITELIST:
@@ -36,13 +59,11 @@ class Handlers:
             return False
         return True
 
-    def _get_derivation_index(self, user_id: int) -> int:
-        users = self.storage.get_users()
-        key = str(user_id)
-        if key not in users:
-            users[key] = len(users)
-            self.storage.save_users(users)
-        return int(users[key])
+    async def _get_derivation_index(self, user_id: int) -> int:
+        return await self.storage.run_sync(self.storage.get_or_assign_index, user_id)
+
+    async def _chat_tokens(self, chat_id: int) -> Dict[str, Dict[str, Any]]:
+        return await self.storage.run_sync(self.storage.get_chat_tokens, chat_id)
 
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         if not await self.check_whitelist(update, context):
@@ -63,13 +84,20 @@ class Handlers:
             "/address - show your derived address\n"
             "/balance [address] - show ETH balance\n"
             "/send - send ETH (guided)\n"
-            "/history [blocks] - scan recent blocks for txs\n"
+            "/send_batch - upload a CSV of address,amount[,token] rows and pay them all\n"
+            "/history [page] - your indexed transactions (or [blocks] to scan when the indexer is off)\n"
             "/sign - sign a message\n"
             "/verify - verify a signed message (paste address, message, signature)\n"
+            "/sign_bulk - upload a text file (one message per line) and get a CSV of signatures\n"
+            "/verify_bulk - upload a CSV of address,message,signature rows and get a CSV of results\n"
             "/faucet [amount] - drip from faucet (dev only)\n"
+            "/faucet_stats - faucet throughput and queue depth\n"
+            "/pending - transactions still waiting to be mined\n"
             "/token_add <symbol> <address> [decimals]\n"
             "/token_balance <symbol>\n"
+            "/token_history <symbol> [blocks] - your recent transfers of a tracked token\n"
             "/token_send - guided token send\n"
+            "/portfolio - ETH and all tracked token balances\n"
         )
 
     async def new(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -79,19 +107,19 @@ class Handlers:
         if not await self.check_whitelist(update, context):
             return
         user = update.effective_user
-        idx = self._get_derivation_index(user.id)
-        acct = self._derive_account_for_index(idx)
+        idx = await self._get_derivation_index(user.id)
+        acct = await self._derive_account_for_index(idx)
         await update.message.reply_text(f"Assigned HD index {idx}. Address: {acct.address}")
 
-    def _derive_account_for_index(self, index: int):
-        return WalletManager(self.wallet.w3, self.wallet.mnemonic, self.wallet.chain_id).derive_account(index)
+    async def _derive_account_for_index(self, index: int):
+        return await self.wallet.account(index)
 
     async def address(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         if not await self.check_whitelist(update, context):
             return
         user = update.effective_user
-        idx = self._get_derivation_index(user.id)
-        acct = self._derive_account_for_index(idx)
+        idx = await self._get_derivation_index(user.id)
+        acct = await self._derive_account_for_index(idx)
         await update.message.reply_text(f"Your address: {acct.address}")
 
     async def balance(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -102,15 +130,15 @@ class Handlers:
             addr = args[0]
         else:
             user = update.effective_user
-            idx = self._get_derivation_index(user.id)
-            acct = self._derive_account_for_index(idx)
+            idx = await self._get_derivation_index(user.id)
+            acct = await self._derive_account_for_index(idx)
             addr = acct.address
         try:
             checksum = Web3.to_checksum_address(addr)
         except Exception:
             await update.message.reply_text("❌ Invalid address")
             return
-        bal = self.wallet.get_balance(checksum)
+        bal = await self.flights.do(("balance", checksum), lambda: self.wallet.get_balance(checksum))
         await update.message.reply_text(f"Balance of {checksum}: {bal} ETH")
 
     async def send_start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -139,22 +167,70 @@ class Handlers:
             await update.message.reply_text("❌ Invalid amount")
             return ConversationHandler.END
         user = update.effective_user
-        idx = self._get_derivation_index(user.id)
-        acct = self._derive_account_for_index(idx)
+        idx = await self._get_derivation_index(user.id)
+        acct = await self._derive_account_for_index(idx)
         to = context.user_data.get("send_to")
         value_wei = int((amount * Decimal(10**18)).to_integral_value())
         try:
-            tx_hash = self.wallet.send_eth(acct, to, value_wei)
+            tx_hash = await self.wallet.send_eth(acct, to, value_wei, chat_id=update.effective_chat.id)
         except Exception as e:
             await update.message.reply_text(f"❌ Failed to send: {e}")
             return ConversationHandler.END
-        await update.message.reply_text(f"✅ Sent {amount} ETH to {to}. Tx: {tx_hash}")
+        await update.message.reply_text(f"✅ Sent {amount} ETH to {to}. Tx: {tx_hash}{self._tracking_note()}")
         return ConversationHandler.END
 
     async def send_cancel(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Send cancelled.")
         return ConversationHandler.END
 
+    async def send_batch_start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if not await self.check_whitelist(update, context):
+            return ConversationHandler.END
+        await update.message.reply_text(
+            f"Upload a CSV of address,amount[,token] rows (max {config.BATCH_MAX_ROWS}). "
+            "Amounts are in ETH or token units; leave token empty for ETH. Nothing is sent unless every row is valid."
+        )
+        return BULK_FILE
+
+    async def send_batch_finish(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        data = await self._read_upload(update)
+        if data is None:
+            return BULK_FILE
+        try:
+            payouts, errors = parse_payouts(data, config.BATCH_MAX_ROWS)
+        except (ValueError, csv.Error) as e:
+            await update.message.reply_text(f"Batch send failed: {e}")
+            return ConversationHandler.END
+        if not payouts and not errors:
+            await update.message.reply_text("The file has no rows.")
+            return ConversationHandler.END
+        chat_id = update.effective_chat.id
+        acct = await self._derive_account_for_index(await self._get_derivation_index(update.effective_user.id))
+        if not errors:
+            try:
+                txs, errors = await self.payer.validate(chat_id, acct.address, payouts, await self._chat_tokens(chat_id))
+            except Exception as e:
+                await update.message.reply_text(f"Batch send failed: {e}")
+                return ConversationHandler.END
+        if errors:
+            shown = "\n".join(errors[:20])
+            more = f"\n… and {len(errors) - 20} more" if len(errors) > 20 else ""
+            await update.message.reply_text(f"❌ Nothing was sent; {len(errors)} problem(s):\n{shown}{more}")
+            return ConversationHandler.END
+        try:
+            sign_s, send_s = await self.payer.pay(acct, payouts, txs, chat_id)
+        except Exception as e:
+            await update.message.reply_text(f"Batch send failed: {e}")
+            return ConversationHandler.END
+        sent = sum(1 for p in payouts if p.status != FAILED)
+        rate = sent / send_s if send_s > 0 else 0.0
+        await update.message.reply_document(
+            document=io.BytesIO(to_csv(PAYOUT_HEADER, [p.row() for p in payouts])),
+            filename="payouts.csv",
+            caption=f"Sent {sent}/{len(payouts)} from {acct.address}: signed in {sign_s:.2f}s, broadcast in {send_s:.2f}s ({rate:.0f} tx/s){self._tracking_note()}",
+        )
+        return ConversationHandler.END
+
     async def faucet(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         if not await self.check_whitelist(update, context):
             return
@@ -164,40 +240,114 @@ class Handlers:
         amount = Decimal(context.args[0]) if context.args else Decimal("0.1")
         amount_wei = int((amount * Decimal(10**18)).to_integral_value())
         user = update.effective_user
-        idx = self._get_derivation_index(user.id)
-        acct = self._derive_account_for_index(idx)
+        idx = await self._get_derivation_index(user.id)
+        acct = await self._derive_account_for_index(idx)
         try:
-            tx_hash = self.wallet.faucet(acct.address, amount_wei)
+            if self.dispenser is not None:
+                tx_hash = await self.dispenser.drip(acct.address, amount_wei)
+                if tx_hash != SET_BALANCE and self.wallet.receipts is not None:
+                    self.wallet.receipts.track(tx_hash, chat_id=update.effective_chat.id)
+            else:
+                tx_hash = await self.wallet.faucet(acct.address, amount_wei, chat_id=update.effective_chat.id)
         except Exception as e:
             await update.message.reply_text(f"Faucet failed: {e}")
             return
-        await update.message.reply_text(f"Dripped {amount} ETH to {acct.address}. Tx: {tx_hash}")
+        if tx_hash == SET_BALANCE:
+            await update.message.reply_text(f"Dripped {amount} ETH to {acct.address} (via {SET_BALANCE})")
+            return
+        await update.message.reply_text(f"Dripped {amount} ETH to {acct.address}. Tx: {tx_hash}{self._tracking_note()}")
+
+    async def faucet_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if not await self.check_whitelist(update, context):
+            return
+        if self.dispenser is None:
+            await update.message.reply_text("Faucet dispenser not running")
+            return
+        stats = self.dispenser.stats()
+        await update.message.reply_text(
+            f"Faucet: {stats['drips']} drips in {stats['batches']} batches, "
+            f"{stats['drips_per_second']:.2f} drips/s, queue depth {stats['queue_depth']}"
+        )
+
+    def _tracking_note(self) -> str:
+        return "\nYou'll get a message once it is mined." if self.wallet.receipts is not None else ""
+
+    async def pending(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if not await self.check_whitelist(update, context):
+            return
+        tracker = self.wallet.receipts
+        if tracker is None:
+            await update.message.reply_text("Receipt tracking is disabled")
+            return
+        stats = tracker.stats()
+        await update.message.reply_text(
+            f"Pending in this chat: {tracker.pending_count(update.effective_chat.id)}\n"
+            f"All chats: {stats['pending']} pending, {stats['confirmed']} confirmed, "
+            f"{stats['reverted']} reverted, {stats['dropped']} dropped"
+        )
 
     async def history(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         if not await self.check_whitelist(update, context):
             return
         user = update.effective_user
-        idx = self._get_derivation_index(user.id)
-        acct = self._derive_account_for_index(idx)
-        blocks = int(context.args[0]) if context.args else 100
-        latest = self.wallet.w3.eth.block_number
+        idx = await self._get_derivation_index(user.id)
+        acct = await self._derive_account_for_index(idx)
+        if self.indexer is not None:
+            await self._history_from_index(update, context, acct.address)
+            return
+        try:
+            blocks = int(context.args[0]) if context.args else 100
+            if blocks < 1:
+                raise ValueError
+        except ValueError:
+            await update.message.reply_text("Usage: /history [blocks]")
+            return
+        blocks = min(blocks, config.HISTORY_MAX_BLOCKS)
+        latest = await self.wallet.block_number()
         start = max(0, latest - blocks + 1)
-        hits = []
-        await update.message.reply_text(f"Scanning {start}..{latest} for txs involving {acct.address} ...")
-        for n in range(start, latest + 1):
-            block = self.wallet.w3.eth.get_block(n, full_transactions=True)
-            for tx in block.transactions:
-                frm = tx.get("from", "")
-                to = tx.get("to", "")
-                if (frm and frm.lower() == acct.address.lower()) or (to and to.lower() == acct.address.lower()):
-                    hits.append(tx.get("hash").hex())
-            if len(hits) >= 20:
-                break
+        header = f"Scanning {start}..{latest} for txs involving {acct.address} ..."
+        status = await update.message.reply_text(header)
+
+        async def scan():
+            hits = []
+            last_edit = time.monotonic()
+            async with contextlib.aclosing(self.wallet.scan_address(acct.address, start, latest)) as matches:
+                async for _, tx_hash in matches:
+                    hits.append(tx_hash)
+                    if len(hits) >= 20:
+                        break
+                    # Stream partial results, throttled to stay inside Telegram's edit limits.
+                    if time.monotonic() - last_edit >= 1.0:
+                        await status.edit_text(header + "\n" + "\n".join(hits))
+                        last_edit = time.monotonic()
+            return hits
+
+        hits = await self.flights.do(("history", acct.address, start, latest), scan)
         if not hits:
             await update.message.reply_text("(no recent transactions found)")
         else:
             await update.message.reply_text("\n".join(hits))
 
+    async def _history_from_index(self, update: Update, context: ContextTypes.DEFAULT_TYPE, address: str):
+        try:
+            page = max(1, int(context.args[0])) if context.args else 1
+        except ValueError:
+            await update.message.reply_text("Usage: /history [page]")
+            return
+        size = config.HISTORY_PAGE_SIZE
+        rows, total = await self.wallet.run_sync(self.indexer.lookup, address, size, (page - 1) * size)
+        height = await self.wallet.run_sync(self.indexer.last_indexed)
+        pages = max(1, -(-total // size))
+        if not rows:
+            if total:
+                await update.message.reply_text(f"Page {page} is empty; there are {pages} page(s).")
+            else:
+                await update.message.reply_text(f"(no transactions found; indexed up to block {height})")
+            return
+        lines = [f"#{block} {direction:<3} {tx_hash}" for block, direction, tx_hash in rows]
+        lines.append(f"Page {page}/{pages} · {total} txs · indexed up to block {height}")
+        await update.message.reply_text("\n".join(lines))
+
     async def sign_start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         if not await self.check_whitelist(update, context):
             return ConversationHandler.END
@@ -206,12 +356,13 @@ class Handlers:
 
     async def sign_finish(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user = update.effective_user
-        idx = self._get_derivation_index(user.id)
-        acct = self._derive_account_for_index(idx)
+        idx = await self._get_derivation_index(user.id)
+        acct = await self._derive_account_for_index(idx)
         message = update.message.text
         from eth_account.messages import encode_defunct
         m = encode_defunct(text=message)
-        sig = acct.sign_message(m).signature.hex()
+        signed = await self.wallet.run_sync(acct.sign_message, m)
+        sig = signed.signature.hex()
         await update.message.reply_text(f"Signature:\n{sig}")
         return ConversationHandler.END
 
@@ -228,13 +379,79 @@ class Handlers:
             from eth_account.messages import encode_defunct
             m = encode_defunct(text=message)
             from eth_account import Account
-            signer = Account.recover_message(m, signature=signature)
+            signer = await self.wallet.run_sync(Account.recover_message, m, signature=signature)
             ok = Web3.to_checksum_address(signer) == Web3.to_checksum_address(addr)
             await update.message.reply_text(f"Verified: {ok}\nRecovered: {signer}")
         except Exception as e:
             await update.message.reply_text(f"Verify failed: {e}")
         return ConversationHandler.END
 
+    async def _read_upload(self, update: Update) -> Optional[bytes]:
+        document = update.message.document
+        if document is None:
+            await update.message.reply_text("Please upload a file (or /cancel).")
+            return None
+        if document.file_size and document.file_size > config.BULK_MAX_BYTES:
+            await update.message.reply_text(f"File too large (max {config.BULK_MAX_BYTES} bytes).")
+            return None
+        file = await document.get_file()
+        return bytes(await file.download_as_bytearray())
+
+    async def sign_bulk_start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if not await self.check_whitelist(update, context):
+            return ConversationHandler.END
+        await update.message.reply_text(f"Upload a text file with one message per line (max {config.BULK_MAX_ROWS}):")
+        return BULK_FILE
+
+    async def sign_bulk_finish(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        data = await self._read_upload(update)
+        if data is None:
+            return BULK_FILE
+        try:
+            messages = parse_messages(data, config.BULK_MAX_ROWS)
+        except ValueError as e:
+            await update.message.reply_text(f"Bulk sign failed: {e}")
+            return ConversationHandler.END
+        if not messages:
+            await update.message.reply_text("The file has no messages.")
+            return ConversationHandler.END
+        acct = await self._derive_account_for_index(await self._get_derivation_index(update.effective_user.id))
+        signatures = await self.signer.sign(bytes(acct.key), messages)
+        rows = [(m, sig, acct.address) for m, sig in zip(messages, signatures)]
+        await update.message.reply_document(
+            document=io.BytesIO(to_csv(SIGN_HEADER, rows)),
+            filename="signatures.csv",
+            caption=f"Signed {len(rows)} messages with {acct.address}",
+        )
+        return ConversationHandler.END
+
+    async def verify_bulk_start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if not await self.check_whitelist(update, context):
+            return ConversationHandler.END
+        await update.message.reply_text(f"Upload a CSV of address,message,signature rows (max {config.BULK_MAX_ROWS}):")
+        return BULK_FILE
+
+    async def verify_bulk_finish(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        data = await self._read_upload(update)
+        if data is None:
+            return BULK_FILE
+        try:
+            rows = parse_verify_rows(data, config.BULK_MAX_ROWS)
+        except (ValueError, csv.Error) as e:
+            await update.message.reply_text(f"Bulk verify failed: {e}")
+            return ConversationHandler.END
+        if not rows:
+            await update.message.reply_text("The file has no rows.")
+            return ConversationHandler.END
+        results = await self.signer.verify(rows)
+        valid = sum(1 for r in results if r[4])
+        await update.message.reply_document(
+            document=io.BytesIO(to_csv(VERIFY_HEADER, results)),
+            filename="verified.csv",
+            caption=f"{valid}/{len(results)} signatures valid",
+        )
+        return ConversationHandler.END
+
     async def token_add(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         if not await self.check_whitelist(update, context):
             return
@@ -254,13 +471,14 @@ class Handlers:
                 decimals = int(context.args[2])
             except Exception:
                 decimals = None
-        tokens = self.storage.get_tokens()
-        chat_key = str(update.effective_chat.id)
-        chat_registry = tokens.get(chat_key, {})
-        chat_registry[symbol] = {"address": checksum, "decimals": decimals}
-        tokens[chat_key] = chat_registry
-        self.storage.save_tokens(tokens)
-        await update.message.reply_text(f"Added {symbol} at {checksum} (decimals={decimals})")
+        info = {"address": checksum, "decimals": decimals}
+        if decimals is None:
+            try:
+                info["decimals"], info["symbol"] = await self.tokens.metadata(checksum)
+            except Exception:
+                pass
+        await self.storage.run_sync(self.storage.set_chat_token, update.effective_chat.id, symbol, info)
+        await update.message.reply_text(f"Added {symbol} at {checksum} (decimals={info['decimals']})")
 
     async def token_balance(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         if not await self.check_whitelist(update, context):
@@ -269,24 +487,97 @@ class Handlers:
             await update.message.reply_text("Usage: /token_balance <symbol>")
             return
         symbol = context.args[0].upper()
-        tokens = self.storage.get_tokens()
-        registry = tokens.get(str(update.effective_chat.id), {})
+        chat_id = update.effective_chat.id
+        registry = await self._chat_tokens(chat_id)
         if symbol not in registry:
             await update.message.reply_text("Unknown token in this chat. Use /token_add")
             return
         info = registry[symbol]
-        contract = self.wallet.w3.eth.contract(address=info["address"], abi=[
-            {"name":"balanceOf","inputs":[{"name":"","type":"address"}],"outputs":[{"name":"","type":"uint256"}],"type":"function"},
-            {"name":"decimals","inputs":[],"outputs":[{"name":"","type":"uint8"}],"type":"function"}
-        ])
         user = update.effective_user
-        idx = self._get_derivation_index(user.id)
-        acct = self._derive_account_for_index(idx)
-        bal = contract.functions.balanceOf(acct.address).call()
-        decimals = info.get("decimals") or contract.functions.decimals().call()
+        idx = await self._get_derivation_index(user.id)
+        acct = await self._derive_account_for_index(idx)
+        bal, decimals = await asyncio.gather(
+            self.flights.do(
+                ("token_balance", info["address"], acct.address),
+                lambda: self.tokens.balance_of(info["address"], acct.address),
+            ),
+            self.tokens.decimals(chat_id, symbol, info),
+        )
         human = Decimal(bal) / Decimal(10**int(decimals))
         await update.message.reply_text(f"{symbol} balance: {human}")
 
+    async def token_history(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if not await self.check_whitelist(update, context):
+            return
+        if len(context.args) < 1:
+            await update.message.reply_text("Usage: /token_history <symbol> [blocks]")
+            return
+        symbol = context.args[0].upper()
+        chat_id = update.effective_chat.id
+        registry = await self._chat_tokens(chat_id)
+        if symbol not in registry:
+            await update.message.reply_text("Unknown token in this chat. Use /token_add")
+            return
+        try:
+            blocks = int(context.args[1]) if len(context.args) > 1 else config.TOKEN_HISTORY_MAX_BLOCKS
+            if blocks < 1:
+                raise ValueError
+        except ValueError:
+            await update.message.reply_text("Usage: /token_history <symbol> [blocks]")
+            return
+        blocks = min(blocks, config.TOKEN_HISTORY_MAX_BLOCKS)
+        info = registry[symbol]
+        acct = await self._derive_account_for_index(await self._get_derivation_index(update.effective_user.id))
+        latest = await self.wallet.block_number()
+        start = max(0, latest - blocks + 1)
+        try:
+            transfers, decimals = await asyncio.gather(
+                self.flights.do(
+                    ("token_history", info["address"], acct.address, start, latest),
+                    lambda: self.logs.transfers(info["address"], acct.address, start, latest),
+                ),
+                self.tokens.decimals(chat_id, symbol, info),
+            )
+        except Exception as e:
+            await update.message.reply_text(f"Token history failed: {e}")
+            return
+        if not transfers:
+            await update.message.reply_text(f"(no {symbol} transfers in blocks {start}..{latest})")
+            return
+        unit = Decimal(10**int(decimals))
+        shown = transfers[:config.HISTORY_PAGE_SIZE]
+        lines = [
+            f"#{t.block} {t.direction:<4} {Decimal(t.value) / unit} {Web3.to_checksum_address(t.counterparty)} {t.tx_hash}"
+            for t in shown
+        ]
+        lines.append(f"{len(shown)} of {len(transfers)} {symbol} transfers · blocks {start}..{latest}")
+        await update.message.reply_text("\n".join(lines))
+
+    async def portfolio(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if not await self.check_whitelist(update, context):
+            return
+        chat_id = update.effective_chat.id
+        registry = await self._chat_tokens(chat_id)
+        user = update.effective_user
+        idx = await self._get_derivation_index(user.id)
+        acct = await self._derive_account_for_index(idx)
+        try:
+            eth_wei, balances = await self.portfolio_reader.read(acct.address, registry)
+        except Exception as e:
+            await update.message.reply_text(f"Portfolio failed: {e}")
+            return
+        lines = [f"Portfolio of {acct.address}", f"ETH: {Decimal(eth_wei) / Decimal(10**18)}"]
+        for symbol in sorted(balances):
+            bal, decimals = balances[symbol]
+            info = registry[symbol]
+            if info.get("decimals") is None and decimals is not None:
+                await self.storage.run_sync(self.storage.set_chat_token, chat_id, symbol, {**info, "decimals": decimals})
+            if bal is None or decimals is None:
+                lines.append(f"{symbol}: (unavailable)")
+            else:
+                lines.append(f"{symbol}: {Decimal(bal) / Decimal(10**int(decimals))}")
+        await update.message.reply_text("\n".join(lines))
+
     async def token_send_start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         if not await self.check_whitelist(update, context):
             return ConversationHandler.END
@@ -295,8 +586,7 @@ class Handlers:
 
     async def token_send_symbol(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         symbol = update.message.text.strip().upper()
-        tokens = self.storage.get_tokens()
-        registry = tokens.get(str(update.effective_chat.id), {})
+        registry = await self._chat_tokens(update.effective_chat.id)
         if symbol not in registry:
             await update.message.reply_text("Unknown token. Use /token_add")
             return ConversationHandler.END
@@ -321,21 +611,18 @@ class Handlers:
             await update.message.reply_text("Invalid amount")
             return ConversationHandler.END
         symbol = context.user_data["tsym"]
-        tokens = self.storage.get_tokens()
-        registry = tokens.get(str(update.effective_chat.id), {})
+        chat_id = update.effective_chat.id
+        registry = await self._chat_tokens(chat_id)
         info = registry[symbol]
-        decimals = int(info.get("decimals") or 18)
-        value = int((amount * Decimal(10**decimals)).to_integral_value())
-        contract = self.wallet.w3.eth.contract(address=info["address"], abi=[
-            {"name":"transfer","inputs":[{"name":"to","type":"address"},{"name":"value","type":"uint256"}],"outputs":[{"name":"","type":"bool"}],"type":"function"}
-        ])
-        tx_data = contract.functions.transfer(context.user_data["tto"], value).build_transaction({"from": self._derive_account_for_index(self._get_derivation_index(update.effective_user.id)).address})["data"]
-        acct = self._derive_account_for_index(self._get_derivation_index(update.effective_user.id))
+        acct = await self._derive_account_for_index(await self._get_derivation_index(update.effective_user.id))
         try:
-            tx = self.wallet.build_tx(acct.address, info["address"], 0, data=tx_data)
-            tx_hash = self.wallet.sign_and_send(acct, tx)
+            decimals = await self.tokens.decimals(chat_id, symbol, info)
+            value = int((amount * Decimal(10**decimals)).to_integral_value())
+            tx_data = encode_transfer(context.user_data["tto"], value)
+            tx = await self.wallet.build_tx(acct.address, info["address"], 0, data=tx_data)
+            tx_hash = await self.wallet.sign_and_send(acct, tx, chat_id=chat_id)
         except Exception as e:
             await update.message.reply_text(f"Token send failed: {e}")
             return ConversationHandler.END
-        await update.message.reply_text(f"Sent {amount} {symbol} to {context.user_data['tto']}. Tx: {tx_hash}")
+        await update.message.reply_text(f"Sent {amount} {symbol} to {context.user_data['tto']}. Tx: {tx_hash}{self._tracking_note()}")
         return ConversationHandler.END
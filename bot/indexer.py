@@ -0,0 +1,156 @@
+import asyncio
+import contextlib
+import logging
+import sqlite3
+import threading
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from .storage import BASE
+from .wallet import WalletManager
+
+INDEX_FILE = BASE / "index.sqlite3"
+
+log = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS txs (
+    address TEXT NOT NULL,
+    block INTEGER NOT NULL,
+    tx_index INTEGER NOT NULL,
+    tx_hash TEXT NOT NULL,
+    direction TEXT NOT NULL,
+    PRIMARY KEY (address, tx_hash, direction)
+);
+CREATE INDEX IF NOT EXISTS txs_by_address ON txs (address, block DESC, tx_index DESC);
+CREATE INDEX IF NOT EXISTS txs_by_block ON txs (block);
+CREATE TABLE IF NOT EXISTS blocks (
+    number INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL
+);
+"""
+
+Row = Tuple[int, str, str]
+
+
+class TxIndexer:
+    """Follows the chain and keeps an (address, block, tx hash, direction) index in SQLite.
+
+    Progress is the highest row in ``blocks``, so a restart resumes where the
+    previous run stopped. A parent-hash mismatch (reorg) or a chain that is
+    shorter than the index (e.g. a restarted Anvil) rewinds the index first.
+    """
+
+    def __init__(self, wallet: WalletManager, path: Path = INDEX_FILE, start_block: int = 0, poll_interval: float = 2.0):
+        self.wallet = wallet
+        self.path = path
+        self.start_block = start_block
+        self.poll_interval = poll_interval
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def last_indexed(self) -> Optional[int]:
+        with self._lock:
+            row = self._conn.execute("SELECT MAX(number) FROM blocks").fetchone()
+        return row[0]
+
+    def _block_hash(self, number: int) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT hash FROM blocks WHERE number = ?", (number,)).fetchone()
+        return row[0] if row else None
+
+    def _rewind(self, to_block: int):
+        # Drops everything above to_block.
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM txs WHERE block > ?", (to_block,))
+            self._conn.execute("DELETE FROM blocks WHERE number > ?", (to_block,))
+
+    def _store_block(self, number: int, block_hash: str, rows: List[tuple]):
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR IGNORE INTO txs VALUES (?, ?, ?, ?, ?)", rows)
+            self._conn.execute("INSERT OR REPLACE INTO blocks VALUES (?, ?)", (number, block_hash))
+
+    @staticmethod
+    def rows_for_block(block) -> List[tuple]:
+        rows = []
+        for i, tx in enumerate(block.transactions):
+            tx_hash = tx["hash"].hex()
+            frm = tx.get("from")
+            to = tx.get("to")
+            if frm:
+                rows.append((frm.lower(), block.number, i, tx_hash, "out"))
+            if to:
+                rows.append((to.lower(), block.number, i, tx_hash, "in"))
+        return rows
+
+    async def index_block(self, block) -> bool:
+        """Stores one block; returns False (after rewinding) if it does not extend the index."""
+        parent = await self.wallet.run_sync(self._block_hash, block.number - 1)
+        if parent is not None and parent != block.parentHash.hex():
+            log.warning("Reorg detected at block %s, rewinding index", block.number)
+            await self.wallet.run_sync(self._rewind, block.number - 2)
+            self.wallet.nonces.reset()
+            return False
+        await self.wallet.run_sync(self._store_block, block.number, block.hash.hex(), self.rows_for_block(block))
+        return True
+
+    async def sync_once(self) -> int:
+        """Indexes every block up to the current head; returns the new indexed height."""
+        latest = await self.wallet.block_number()
+        last = await self.wallet.run_sync(self.last_indexed)
+        if last is not None and last > latest:
+            log.warning("Chain head %s is below indexed height %s, rewinding index", latest, last)
+            await self.wallet.run_sync(self._rewind, latest)
+            self.wallet.nonces.reset()
+            last = latest
+        n = self.start_block if last is None else last + 1
+        while n <= latest:
+            async with contextlib.aclosing(self.wallet.iter_blocks(n, latest)) as blocks:
+                async for block in blocks:
+                    if not await self.index_block(block):
+                        n = max(self.start_block, block.number - 1)
+                        break
+                    n = block.number + 1
+        return latest
+
+    async def run(self):
+        while True:
+            try:
+                await self.sync_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("Indexer pass failed")
+            await asyncio.sleep(self.poll_interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run(), name="tx-indexer")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        with self._lock:
+            self._conn.close()
+
+    def lookup(self, address: str, limit: int = 20, offset: int = 0) -> Tuple[List[Row], int]:
+        """Returns ((block, direction, tx hash) rows, newest first; total row count) for an address."""
+        key = address.lower()
+        with self._lock:
+            total = self._conn.execute("SELECT COUNT(*) FROM txs WHERE address = ?", (key,)).fetchone()[0]
+            rows = self._conn.execute(
+                "SELECT block, direction, tx_hash FROM txs WHERE address = ? "
+                "ORDER BY block DESC, tx_index DESC LIMIT ? OFFSET ?",
+                (key, limit, offset),
+            ).fetchall()
+        return rows, total
@@ -0,0 +1,112 @@
+import asyncio
+import logging
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from web3 import Web3
+
+log = logging.getLogger(__name__)
+
+TRANSFER_TOPIC = Web3.keccak(text="Transfer(address,address,uint256)").to_0x_hex()
+
+# Substrings of the errors nodes return when an eth_getLogs range or result set is too big.
+LIMIT_HINTS = ("limit", "range", "too many", "too large", "exceed", "response size", "timeout", "timed out", "10000")
+
+
+def is_limit_error(e: Exception) -> bool:
+    return isinstance(e, TimeoutError) or any(h in str(e).lower() for h in LIMIT_HINTS)
+
+
+def address_topic(address: str) -> str:
+    return "0x" + "0" * 24 + address[2:].lower()
+
+
+class Transfer(NamedTuple):
+    block: int
+    log_index: int
+    tx_hash: str
+    direction: str  # IN, OUT or SELF
+    counterparty: str
+    value: int
+
+
+def decode_transfers(logs: Iterable[Any], owner: str) -> List[Transfer]:
+    """Decodes ERC-20 Transfer logs seen by owner in one pass, newest first.
+
+    A log matched by both the sent and the received query appears once.
+    Logs with a different topic layout (e.g. ERC-721) are skipped.
+    """
+    owner = owner.lower()
+    seen: Dict[Tuple[str, int], Transfer] = {}
+    for entry in logs:
+        topics = entry["topics"]
+        if len(topics) != 3:
+            continue
+        frm = "0x" + bytes(topics[1])[-20:].hex()
+        to = "0x" + bytes(topics[2])[-20:].hex()
+        if frm == owner and to == owner:
+            direction, counterparty = "SELF", owner
+        elif frm == owner:
+            direction, counterparty = "OUT", to
+        else:
+            direction, counterparty = "IN", frm
+        tx_hash = entry["transactionHash"].to_0x_hex()
+        seen[(tx_hash, entry["logIndex"])] = Transfer(
+            entry["blockNumber"], entry["logIndex"], tx_hash, direction, counterparty,
+            int.from_bytes(bytes(entry["data"])[:32], "big"),
+        )
+    return sorted(seen.values(), key=lambda t: (t.block, t.log_index), reverse=True)
+
+
+class LogScanner:
+    """eth_getLogs over long block ranges, in chunks sized to what the node accepts.
+
+    A range is split into ``chunk_size`` blocks fetched up to ``max_in_flight``
+    at a time. A chunk refused for its size (range caps, result caps,
+    timeouts) is halved and retried, and the smaller size is kept for later
+    scans; a scan with no refusals doubles it again, up to ``max_chunk`` but
+    below the smallest size the node has refused.
+    """
+
+    def __init__(self, wallet, chunk_size: int = 2000, max_chunk: int = 100000, max_in_flight: int = 4):
+        self.wallet = wallet
+        self.chunk_size = chunk_size
+        self.max_chunk = max_chunk
+        self._refused_at: Optional[int] = None
+        self._sem = asyncio.Semaphore(max_in_flight)
+
+    async def _fetch(self, params: Dict[str, Any], start: int, end: int, refused: List[int]) -> List[Any]:
+        try:
+            async with self._sem:
+                return list(await self.wallet.rpc(self.wallet.w3.eth.get_logs, {**params, "fromBlock": start, "toBlock": end}))
+        except Exception as e:
+            if end <= start or not is_limit_error(e):
+                raise
+            log.info("eth_getLogs %d..%d refused (%s); splitting", start, end, e)
+        refused.append(end - start + 1)
+        self._refused_at = min(self._refused_at or end - start + 1, end - start + 1)
+        self.chunk_size = max(1, min(self.chunk_size, (end - start + 1) // 2))
+        mid = (start + end) // 2
+        left, right = await asyncio.gather(self._fetch(params, start, mid, refused), self._fetch(params, mid + 1, end, refused))
+        return left + right
+
+    async def get_logs(self, params: Dict[str, Any], start: int, end: int) -> List[Any]:
+        """Logs matching params (address/topics) in start..end inclusive, in block order."""
+        size = self.chunk_size
+        refused: List[int] = []
+        chunks = await asyncio.gather(*(
+            self._fetch(params, s, min(s + size - 1, end), refused) for s in range(start, end + 1, size)
+        ))
+        if not refused and end - start + 1 >= size:
+            ceiling = self.max_chunk if self._refused_at is None else min(self.max_chunk, self._refused_at - 1)
+            self.chunk_size = max(size, min(ceiling, size * 2))
+        return [entry for chunk in chunks for entry in chunk]
+
+    async def transfers(self, token: str, owner: str, start: int, end: int) -> List[Transfer]:
+        """ERC-20 transfers from or to owner; sent and received are two indexed-topic queries."""
+        token = Web3.to_checksum_address(token)
+        topic = address_topic(owner)
+        sent, received = await asyncio.gather(
+            self.get_logs({"address": token, "topics": [TRANSFER_TOPIC, topic]}, start, end),
+            self.get_logs({"address": token, "topics": [TRANSFER_TOPIC, None, topic]}, start, end),
+        )
+        return decode_transfers(sent + received, owner)
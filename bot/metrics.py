@@ -0,0 +1,201 @@
+import contextlib
+import functools
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+log = logging.getLogger(__name__)
+
+# Seconds; spans a cached lookup up to a slow RPC or Telegram call.
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[str, ...]
+
+
+def _format_labels(names: Tuple[str, ...], values: Labels, extra: str = "") -> str:
+    pairs = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help_: str, labels: Tuple[str, ...] = ()):
+        self.name, self.help, self.labels = name, help_, labels
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, v in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, labels)} {v}")
+        return lines
+
+
+class Gauge(Counter):
+    def dec(self, *labels: str):
+        self.inc(*labels, amount=-1)
+
+    def set(self, value: float, *labels: str):
+        with self._lock:
+            self._values[labels] = value
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help_, labels, buckets
+        # labels -> [bucket counts..., count, sum]
+        self._values: Dict[Labels, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, *labels: str):
+        with self._lock:
+            row = self._values.get(labels)
+            if row is None:
+                row = self._values[labels] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    row[i] += 1
+            row[-2] += 1
+            row[-1] += seconds
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, row in sorted(self._values.items()):
+                for bound, n in zip(self.buckets, row):
+                    le = f'le="{bound}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labels, labels, le)} {n}")
+                le = 'le="+Inf"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, labels, le)} {row[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, labels)} {row[-2]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, labels)} {row[-1]}")
+        return lines
+
+
+class Metrics:
+    """Process-wide metrics, exported in the Prometheus text format.
+
+    Disabled by default: the handler and RPC wrappers are only installed by
+    ``enable``, and ``timer`` hands out a shared no-op context until then.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.rpc_seconds = Histogram("etm_rpc_seconds", "JSON-RPC call latency", ("method",))
+        self.rpc_errors = Counter("etm_rpc_errors_total", "JSON-RPC calls that raised or returned an error", ("method",))
+        self.handler_seconds = Histogram("etm_handler_seconds", "Telegram handler latency", ("handler",))
+        self.handler_errors = Counter("etm_handler_errors_total", "Telegram handlers that raised", ("handler",))
+        self.handler_in_flight = Gauge("etm_handler_in_flight", "Telegram handlers currently running", ("handler",))
+        self.telegram_seconds = Histogram("etm_telegram_api_seconds", "Bot API request latency", ("method",))
+        self.section_seconds = Histogram("etm_section_seconds", "Time spent in storage I/O, key derivation and similar sections", ("section",))
+        self.cache_lookups = Counter("etm_block_cache_lookups_total", "Block cache lookups by kind and result", ("kind", "result"))
+        self.startup_seconds = Gauge("etm_startup_seconds", "Seconds from process start until each startup phase finished", ("phase",))
+        self._null = contextlib.nullcontext()
+        self._runner = None
+
+    def enable(self):
+        self.enabled = True
+
+    def _all(self) -> list:
+        return [
+            self.rpc_seconds, self.rpc_errors, self.handler_seconds, self.handler_errors,
+            self.handler_in_flight, self.telegram_seconds, self.section_seconds, self.cache_lookups, self.startup_seconds,
+        ]
+
+    def render(self) -> str:
+        return "\n".join(line for m in self._all() for line in m.render()) + "\n"
+
+    @contextlib.contextmanager
+    def _timed(self, section: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.section_seconds.observe(time.perf_counter() - started, section)
+
+    def timer(self, section: str):
+        """Context manager timing a block of code under etm_section_seconds."""
+        return self._timed(section) if self.enabled else self._null
+
+    def wrap_handler(self, fn: Callable[..., Any]) -> Callable[..., Any]:
+        name = getattr(fn, "__name__", repr(fn))
+
+        @functools.wraps(fn)
+        async def wrapper(*args: Any, **kwargs: Any):
+            self.handler_in_flight.inc(name)
+            started = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            except Exception:
+                self.handler_errors.inc(name)
+                raise
+            finally:
+                self.handler_seconds.observe(time.perf_counter() - started, name)
+                self.handler_in_flight.dec(name)
+
+        return wrapper
+
+    def instrument_application(self, app):
+        """Wraps the callback of every registered handler, including conversation states."""
+        def wrap(handler):
+            handler.callback = self.wrap_handler(handler.callback)
+
+        for group in app.handlers.values():
+            for handler in group:
+                if hasattr(handler, "entry_points"):
+                    for h in handler.entry_points + handler.fallbacks:
+                        wrap(h)
+                    for state_handlers in handler.states.values():
+                        for h in state_handlers:
+                            wrap(h)
+                else:
+                    wrap(handler)
+
+    async def serve(self, host: str, port: int):
+        from aiohttp import web
+
+        async def handle(request):
+            return web.Response(text=self.render(), content_type="text/plain", charset="utf-8")
+
+        app = web.Application()
+        app.router.add_get("/metrics", handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        log.warning("Metrics on http://%s:%d/metrics", host, port)
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+metrics = Metrics()
+
+
+def timed_request(**kwargs: Any):
+    """An HTTPXRequest for ApplicationBuilder.request() that times each Bot API call by method."""
+    # Imported here so storage and wallet code can use metrics without pulling in telegram.
+    from telegram.request import HTTPXRequest
+
+    class TimedHTTPXRequest(HTTPXRequest):
+        async def do_request(self, url: str, method: str, *args: Any, **kw: Any):
+            started = time.perf_counter()
+            try:
+                return await super().do_request(url, method, *args, **kw)
+            finally:
+                metrics.telegram_seconds.observe(time.perf_counter() - started, url.rsplit("/", 1)[-1])
+
+    return TimedHTTPXRequest(**kwargs)
@@ -0,0 +1,152 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from eth_abi import decode, encode
+from eth_utils import function_signature_to_4byte_selector
+from web3 import Web3
+
+from .tokens import BALANCE_OF_SELECTOR, DECIMALS_SELECTOR, TokenMetadata
+from .wallet import WalletManager
+
+log = logging.getLogger(__name__)
+
+MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+AGGREGATE3_SELECTOR = function_signature_to_4byte_selector("aggregate3((address,bool,bytes)[])")
+GET_ETH_BALANCE_SELECTOR = function_signature_to_4byte_selector("getEthBalance(address)")
+# contracts/Multicall3.vy caps one aggregate3 call at 512 sub-calls.
+MAX_CALLS = 512
+
+# Runtime code of contracts/Multicall3.vy (vyper 0.4.3, --evm-version shanghai).
+MULTICALL3_RUNTIME = (
+    "0x"
+    "5f3560e01c60026001821660011b61037501601e395f51565b6382ad56cb811861036d57602436103417610371576004"
+    "356004016102008135116103715780355f8161020081116103715780156100b557905b8060051b602085010135602085"
+    "010160e0820260600181358060a01c61037157815260208201358060011c610371576020820152604082013582018035"
+    "608081116103715750602081350160408301818382375050505050600101818118610052575b50508060405250505f62"
+    "01c060525f604051610200811161037157801561027d57905b60e08102606001805162034080526020810151620340a0"
+    "5260408101602081510180620340c0828460045afa1561037157505050604036620341603762034080515a620340c060"
+    "80620342408251602084018686fa905090509050620342c0523d608081183d6080100218620342205262034220602081"
+    "510180620342e0828460045afa15610371575050620342c05162034160526020620342e05101806203418082620342e0"
+    "60045afa156103715750620341605161019c57620340a05161019f565b60015b61022b57602080620342805260176203"
+    "4220527f4d756c746963616c6c333a2063616c6c206661696c6564000000000000000000620342405262034220816203"
+    "42800181518152602082015160208201528051806020830101601f825f03163682375050601f19601f82516020010116"
+    "90509050810190506308c379a06203426052806004016203427cfd5b6201c060516101ff81116103715760c081026201"
+    "c08001620341605181526020620341805101602082018181836203418060045afa1561037157505050600181016201c0"
+    "6052506001018181186100d8575b505060208062034080528062034080015f6201c060518083528060051b5f82610200"
+    "811161037157801561032757905b828160051b60208801015260c081026201c080018360208801016040825182528060"
+    "208301526020830181830160208251018082828560045afa1561037157508051806020830101601f825f031636823750"
+    "50601f19601f82516020010116905090508101905090509050830192506001018181186102ad575b5050820160200191"
+    "505090508101905062034080f35b634d2301cc811861036d57602436103417610371576004358060a01c610371576040"
+    "526040513160605260206060f35b5f5ffd5b5f80fd033d0018"
+)
+
+
+def initcode(runtime: str) -> bytes:
+    code = Web3.to_bytes(hexstr=runtime)
+    # PUSH2 len, DUP1, PUSH2 0x0b, PUSH0, CODECOPY, PUSH0, RETURN -- copies the
+    # 11 bytes after this preamble into memory and returns them as the code.
+    return b"\x61" + len(code).to_bytes(2, "big") + b"\x80\x61\x00\x0b\x5f\x39\x5f\xf3" + code
+
+
+class Multicall:
+    """Thin aggregate3() client for Multicall3 at ``address``.
+
+    On Anvil, a missing Multicall3 is installed with ``anvil_setCode`` from
+    contracts/Multicall3.vy; elsewhere it can be deployed with ``deploy``.
+    """
+
+    def __init__(self, wallet: WalletManager, address: str = MULTICALL3_ADDRESS, auto_install: bool = True):
+        self.wallet = wallet
+        self.address = Web3.to_checksum_address(address)
+        self.auto_install = auto_install
+        self._available: Optional[bool] = None
+
+    async def available(self) -> bool:
+        if self._available is None:
+            code = await self.wallet.rpc(self.wallet.w3.eth.get_code, self.address)
+            if not code and self.auto_install and await self.wallet.is_anvil():
+                log.info("Installing Multicall3 at %s via anvil_setCode", self.address)
+                await self.wallet.rpc(self.wallet.w3.provider.make_request, "anvil_setCode", [self.address, MULTICALL3_RUNTIME])
+                code = b"\x01"
+            self._available = bool(code)
+        return self._available
+
+    async def deploy(self, acct) -> str:
+        tx = await self.wallet.build_tx(acct.address, None, 0, data=initcode(MULTICALL3_RUNTIME))
+        tx_hash = await self.wallet.sign_and_send(acct, tx)
+        receipt = await self.wallet.rpc(self.wallet.w3.eth.wait_for_transaction_receipt, tx_hash)
+        self.address = receipt["contractAddress"]
+        self._available = True
+        return self.address
+
+    async def _aggregate3(self, calls: Sequence[Tuple[str, bytes]]) -> List[Tuple[bool, bytes]]:
+        data = AGGREGATE3_SELECTOR + encode(["(address,bool,bytes)[]"], [[(t, True, d) for t, d in calls]])
+        raw = await self.wallet.rpc(self.wallet.w3.eth.call, {"to": self.address, "data": data})
+        return decode(["(bool,bytes)[]"], raw)[0]
+
+    async def aggregate3(self, calls: Sequence[Tuple[str, bytes]]) -> List[Tuple[bool, bytes]]:
+        """Runs (target, calldata) pairs in one eth_call per MAX_CALLS; failures come back as (False, b"")."""
+        chunks = [calls[i:i + MAX_CALLS] for i in range(0, len(calls), MAX_CALLS)]
+        results = await asyncio.gather(*(self._aggregate3(c) for c in chunks))
+        return [r for chunk in results for r in chunk]
+
+
+def _uint(ok: bool, data: bytes) -> Optional[int]:
+    return int.from_bytes(data[:32], "big") if ok and len(data) >= 32 else None
+
+
+class PortfolioReader:
+    """ETH plus every tracked ERC-20 balance (and missing decimals) in one round trip.
+
+    Uses Multicall3 when available and a JSON-RPC batch of eth_getBalance and
+    eth_call otherwise (or with mode="batch").
+    """
+
+    def __init__(self, wallet: WalletManager, tokens: TokenMetadata, multicall: Optional[Multicall] = None, mode: str = "multicall"):
+        self.wallet = wallet
+        self.tokens = tokens
+        self.multicall = multicall
+        self.mode = mode
+
+    def _token_calls(self, owner: str, registry: Dict[str, dict]) -> List[Tuple[str, str, bytes]]:
+        owner_arg = encode(["address"], [owner])
+        calls = []
+        for symbol, info in registry.items():
+            calls.append((symbol, info["address"], BALANCE_OF_SELECTOR + owner_arg))
+            if info.get("decimals") is None and self.tokens.cached_decimals(info["address"]) is None:
+                calls.append((symbol, info["address"], DECIMALS_SELECTOR))
+        return calls
+
+    async def read(self, owner: str, registry: Dict[str, dict]) -> Tuple[int, Dict[str, Tuple[Optional[int], Optional[int]]]]:
+        """Returns (ETH wei, {symbol: (raw balance, decimals)}); a failed read is None."""
+        owner = Web3.to_checksum_address(owner)
+        calls = self._token_calls(owner, registry)
+        if self.mode == "multicall" and self.multicall is not None and await self.multicall.available():
+            results = await self.multicall.aggregate3(
+                [(self.multicall.address, GET_ETH_BALANCE_SELECTOR + encode(["address"], [owner]))]
+                + [(target, data) for _, target, data in calls]
+            )
+            eth = _uint(*results[0])
+            values = [_uint(ok, data) for ok, data in results[1:]]
+        else:
+            eth_call = self.wallet.w3.eth.call
+            results = await self.wallet.batch(
+                [(self.wallet.w3.eth.get_balance, (owner,))]
+                + [(eth_call, ({"to": target, "data": data},)) for _, target, data in calls]
+            )
+            eth = results[0]
+            values = [_uint(True, bytes(r)) for r in results[1:]]
+        out: Dict[str, Tuple[Optional[int], Optional[int]]] = {}
+        for symbol, info in registry.items():
+            decimals = info.get("decimals")
+            if decimals is None:
+                decimals = self.tokens.cached_decimals(info["address"])
+            out[symbol] = (None, decimals)
+        for (symbol, target, data), value in zip(calls, values):
+            bal, decimals = out[symbol]
+            if data[:4] == DECIMALS_SELECTOR:
+                out[symbol] = (bal, value)
+            else:
+                out[symbol] = (value, decimals)
+        return eth, out
@@ -0,0 +1,118 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Set
+
+log = logging.getLogger(__name__)
+
+NONCE_ERRORS = (
+    "nonce too low",
+    "replacement transaction underpriced",
+    "replacement underpriced",
+    "nonce has already been used",
+)
+
+# The node already holds this exact signed transaction: it was sent, not rejected.
+ALREADY_KNOWN = ("already known", "known transaction")
+
+
+def is_nonce_error(exc: BaseException) -> bool:
+    msg = str(exc).lower()
+    return any(s in msg for s in NONCE_ERRORS)
+
+
+def is_already_known(exc: BaseException) -> bool:
+    msg = str(exc).lower()
+    return any(s in msg for s in ALREADY_KNOWN)
+
+
+class NonceManager:
+    """Hands out nonces locally so one account can have many transactions in flight.
+
+    The first reservation for an address asks the node for its pending
+    transaction count; after that nonces are allocated from memory. A nonce
+    released below ones already in flight is a gap that would hold them in
+    the node's queue, so the lowest gap is always handed out first. The
+    allocator resyncs from the node after a nonce error or after a reorg
+    (``reset``).
+    """
+
+    def __init__(self, fetch: Callable[[str], Awaitable[int]]):
+        self._fetch = fetch
+        self._next: Dict[str, int] = {}
+        self._in_flight: Dict[str, Set[int]] = {}
+        self._gaps: Dict[str, Set[int]] = {}
+        self._stale: Set[str] = set()
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def _lock(self, address: str) -> asyncio.Lock:
+        lock = self._locks.get(address)
+        if lock is None:
+            lock = self._locks[address] = asyncio.Lock()
+        return lock
+
+    async def _sync(self, address: str):
+        chain_next = await self._fetch(address)
+        in_flight = self._in_flight.setdefault(address, set())
+        # Anything below the node's pending count has been accepted or mined.
+        in_flight.difference_update({n for n in in_flight if n < chain_next})
+        next_nonce = max([chain_next, *(n + 1 for n in in_flight)])
+        self._next[address] = next_nonce
+        # Whatever between the two is not in flight was never broadcast.
+        gaps = set(range(chain_next, next_nonce)) - in_flight
+        if gaps:
+            log.info("Nonce gaps %s for %s will be reused", sorted(gaps), address)
+        self._gaps[address] = gaps
+        self._stale.discard(address)
+
+    def _take(self, address: str, count: int) -> List[int]:
+        gaps = self._gaps.setdefault(address, set())
+        nonces = sorted(gaps)[:count]
+        gaps.difference_update(nonces)
+        first = self._next[address]
+        fresh = count - len(nonces)
+        nonces.extend(range(first, first + fresh))
+        self._next[address] = first + fresh
+        self._in_flight.setdefault(address, set()).update(nonces)
+        return nonces
+
+    async def reserve(self, address: str) -> int:
+        async with self._lock(address):
+            if address not in self._next or address in self._stale:
+                await self._sync(address)
+            return self._take(address, 1)[0]
+
+    async def reserve_many(self, address: str, count: int) -> List[int]:
+        """Reserves count nonces in ascending order, filling gaps first."""
+        async with self._lock(address):
+            if address not in self._next or address in self._stale:
+                await self._sync(address)
+            return self._take(address, count)
+
+    def release(self, address: str, nonce: int):
+        """Returns a reserved nonce whose transaction was never broadcast; the next reservation reuses it."""
+        self._in_flight.get(address, set()).discard(nonce)
+        if nonce >= self._next.get(address, 0):
+            return
+        gaps = self._gaps.setdefault(address, set())
+        gaps.add(nonce)
+        # Released nonces just below _next need no filling; hand them out from _next again.
+        while self._next[address] - 1 in gaps:
+            self._next[address] -= 1
+            gaps.discard(self._next[address])
+
+    def confirm(self, address: str, nonce: int):
+        self._in_flight.get(address, set()).discard(nonce)
+
+    async def resync(self, address: str):
+        async with self._lock(address):
+            self._in_flight.pop(address, None)
+            await self._sync(address)
+
+    def reset(self):
+        """Forgets all local state; called after a reorg or chain reset."""
+        log.info("Resetting local nonce state for %d accounts", len(self._next))
+        self._stale.update(self._next)
+        self._in_flight.clear()
+
+    def in_flight(self, address: str) -> int:
+        return len(self._in_flight.get(address, ()))
@@ -0,0 +1,257 @@
+import asyncio
+import csv
+import io
+import logging
+import time
+from dataclasses import dataclass
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, List, Optional, Tuple
+
+from eth_account.signers.local import LocalAccount
+from web3 import Web3
+
+from .metrics import metrics
+from .nonces import is_already_known, is_nonce_error
+from .signing import BulkSigner
+from .tokens import TokenMetadata, encode_transfer
+from .wallet import WalletManager
+
+log = logging.getLogger(__name__)
+
+PAYOUT_HEADER = ["line", "address", "amount", "token", "nonce", "status", "tx_hash", "error"]
+
+SENT = "sent"
+FAILED = "failed"
+# Broadcast, but behind a failed nonce: mined only once that nonce is used again.
+QUEUED = "queued"
+
+
+@dataclass
+class Payout:
+    line: int
+    to: str
+    amount: Decimal
+    token: Optional[str] = None  # chat registry symbol, None for ETH
+    value: int = 0  # in wei or token base units
+    nonce: Optional[int] = None
+    status: str = ""
+    tx_hash: str = ""
+    error: str = ""
+
+    def row(self) -> Tuple:
+        return (self.line, self.to, self.amount, self.token or "ETH", "" if self.nonce is None else self.nonce, self.status, self.tx_hash, self.error)
+
+
+def parse_payouts(data: bytes, max_rows: int) -> Tuple[List[Payout], List[str]]:
+    """Reads address,amount[,token] CSV rows; a leading header row is skipped.
+
+    Every line is checked, and the problems are returned together so a file
+    can be fixed in one go.
+    """
+    payouts: List[Payout] = []
+    errors: List[str] = []
+    for i, row in enumerate(csv.reader(io.StringIO(data.decode("utf-8-sig")))):
+        line = i + 1
+        if not row or all(not c.strip() for c in row):
+            continue
+        if i == 0 and row[0].strip().lower() == "address":
+            continue
+        if len(row) < 2:
+            errors.append(f"Line {line}: expected address,amount[,token]")
+            continue
+        try:
+            to = Web3.to_checksum_address(row[0].strip())
+        except Exception:
+            errors.append(f"Line {line}: invalid address {row[0].strip()!r}")
+            continue
+        try:
+            amount = Decimal(row[1].strip())
+        except InvalidOperation:
+            errors.append(f"Line {line}: invalid amount {row[1].strip()!r}")
+            continue
+        if not amount.is_finite() or amount <= 0:
+            errors.append(f"Line {line}: amount must be positive")
+            continue
+        token = row[2].strip().upper() if len(row) > 2 and row[2].strip() else None
+        if token == "ETH":
+            token = None
+        payouts.append(Payout(line, to, amount, token))
+        if len(payouts) > max_rows:
+            raise ValueError(f"Too many rows (max {max_rows})")
+    return payouts, errors
+
+
+def _scale(amount: Decimal, decimals: int) -> Optional[int]:
+    scaled = amount.scaleb(decimals)
+    return int(scaled) if scaled == scaled.to_integral_value() else None
+
+
+class BatchPayer:
+    """Sends many ETH and ERC-20 payouts from one account as fast as the node accepts them.
+
+    The whole batch is priced and checked against the sender's balances
+    before anything is signed. Fees are read once, consecutive nonces are
+    reserved in one step, every transaction is signed on the BulkSigner's
+    process pool, and the raw transactions are broadcast in nonce order with
+    up to ``max_in_flight`` outstanding. A failed broadcast releases its nonce,
+    and the NonceManager hands it to the account's next send. Later ones that
+    already went out wait in the node's queue until then, and are reported as
+    queued.
+    """
+
+    def __init__(self, wallet: WalletManager, tokens: TokenMetadata, signer: BulkSigner, max_in_flight: int = 16):
+        self.wallet = wallet
+        self.tokens = tokens
+        self.signer = signer
+        self.max_in_flight = max_in_flight
+
+    async def _resolve_tokens(self, chat_id: int, payouts: List[Payout], registry: Dict[str, Any]) -> Tuple[Dict[str, str], List[str]]:
+        symbols = sorted({p.token for p in payouts if p.token})
+        errors = [f"Unknown token {s} in this chat. Use /token_add" for s in symbols if s not in registry]
+        known = [s for s in symbols if s in registry]
+        decimals = await asyncio.gather(*(self.tokens.decimals(chat_id, s, registry[s]) for s in known), return_exceptions=True)
+        resolved: Dict[str, int] = {}
+        for s, d in zip(known, decimals):
+            if isinstance(d, Exception):
+                errors.append(f"Could not read decimals of {s}: {d}")
+            else:
+                resolved[s] = int(d)
+        for p in payouts:
+            if p.token is None:
+                value = _scale(p.amount, 18)
+            elif p.token in resolved:
+                value = _scale(p.amount, resolved[p.token])
+            else:
+                continue
+            if value is None:
+                errors.append(f"Line {p.line}: {p.amount:f} has more decimals than {p.token or 'ETH'} allows")
+            else:
+                p.value = value
+        return {s: Web3.to_checksum_address(registry[s]["address"]) for s in resolved}, errors
+
+    async def _build(self, sender: str, payouts: List[Payout], addresses: Dict[str, str]) -> Tuple[List[dict], List[str]]:
+        fees = await self.wallet.fees.fee_fields()
+        sem = asyncio.Semaphore(self.max_in_flight)
+        txs = []
+        for p in payouts:
+            if p.token is None:
+                txs.append({"chainId": self.wallet.chain_id, "from": sender, "to": p.to, "value": p.value, "data": b""})
+            else:
+                txs.append({"chainId": self.wallet.chain_id, "from": sender, "to": addresses[p.token], "value": 0, "data": encode_transfer(p.to, p.value)})
+
+        async def estimate(tx: dict) -> int:
+            async with sem:
+                return await self.wallet.fees.estimate_gas(tx)
+
+        # Estimates are cached per (token, selector) and plain sends skip them, so this is mostly local.
+        gas = await asyncio.gather(*(estimate(tx) for tx in txs), return_exceptions=True)
+        errors = []
+        for p, tx, g in zip(payouts, txs, gas):
+            if isinstance(g, Exception):
+                errors.append(f"Line {p.line}: gas estimate failed: {g}")
+            else:
+                tx["gas"] = g
+                tx.update(fees)
+        return txs, errors
+
+    async def _check_funds(self, sender: str, payouts: List[Payout], txs: List[dict], addresses: Dict[str, str]) -> List[str]:
+        price = txs[0].get("gasPrice") or txs[0]["maxFeePerGas"]
+        need_eth = sum(p.value for p in payouts if p.token is None) + sum(tx["gas"] * price for tx in txs)
+        need_tokens: Dict[str, int] = {}
+        for p in payouts:
+            if p.token is not None:
+                need_tokens[p.token] = need_tokens.get(p.token, 0) + p.value
+        symbols = list(need_tokens)
+        eth, *balances = await asyncio.gather(
+            self.wallet.get_balance(sender),
+            *(self.tokens.balance_of(addresses[s], sender) for s in symbols),
+        )
+        errors = []
+        have_eth = int(eth.scaleb(18))
+        if have_eth < need_eth:
+            errors.append(f"Not enough ETH: need {Decimal(need_eth).scaleb(-18)} including gas, have {eth}")
+        for s, have in zip(symbols, balances):
+            if have < need_tokens[s]:
+                errors.append(f"Not enough {s}: need {need_tokens[s]} base units, have {have}")
+        return errors
+
+    async def validate(self, chat_id: int, sender: str, payouts: List[Payout], registry: Dict[str, Any]) -> Tuple[List[dict], List[str]]:
+        """Builds the unsigned transactions (without nonces), or returns every problem found."""
+        addresses, errors = await self._resolve_tokens(chat_id, payouts, registry)
+        if errors:
+            return [], errors
+        txs, errors = await self._build(sender, payouts, addresses)
+        if errors:
+            return [], errors
+        return txs, await self._check_funds(sender, payouts, txs, addresses)
+
+    async def _broadcast(self, acct: LocalAccount, payouts: List[Payout], signed: List[Tuple[bytes, str]]):
+        sem = asyncio.Semaphore(self.max_in_flight)
+
+        async def send(p: Payout, raw: bytes, tx_hash: str):
+            try:
+                await self.wallet.rpc(self.wallet.w3.eth.send_raw_transaction, raw)
+                p.status, p.tx_hash = SENT, tx_hash
+            except Exception as e:
+                if is_already_known(e):
+                    # The node already holds this exact transaction, so it was sent.
+                    p.status, p.tx_hash = SENT, tx_hash
+                else:
+                    p.status, p.error = FAILED, str(e) or type(e).__name__
+            finally:
+                sem.release()
+
+        tasks = []
+        # Started strictly in nonce order so a node that rejects nonce gaps sees them in sequence.
+        for p, (raw, tx_hash) in zip(payouts, signed):
+            await sem.acquire()
+            tasks.append(asyncio.create_task(send(p, raw, tx_hash)))
+        await asyncio.gather(*tasks)
+
+    async def _attempt(self, acct: LocalAccount, payouts: List[Payout], txs: List[dict]) -> Tuple[float, float]:
+        nonces = await self.wallet.nonces.reserve_many(acct.address, len(txs))
+        for p, tx, nonce in zip(payouts, txs, nonces):
+            p.nonce = tx["nonce"] = nonce
+            p.status = p.error = p.tx_hash = ""
+        started = time.perf_counter()
+        try:
+            with metrics.timer("batch_sign"):
+                signed = await self.signer.sign_transactions(bytes(acct.key), txs)
+        except BaseException:
+            for nonce in reversed(nonces):
+                self.wallet.nonces.release(acct.address, nonce)
+            raise
+        signed_at = time.perf_counter()
+        with metrics.timer("batch_broadcast"):
+            await self._broadcast(acct, payouts, signed)
+        return signed_at - started, time.perf_counter() - signed_at
+
+    async def pay(self, acct: LocalAccount, payouts: List[Payout], txs: List[dict], chat_id: Optional[int] = None) -> Tuple[float, float]:
+        """Signs and broadcasts validated payouts; returns (signing, broadcast) seconds.
+
+        Each payout's status, nonce, tx_hash and error are filled in. If a
+        receipt tracker is set, chat_id is told the outcome of each one.
+        """
+        sign_s, send_s = await self._attempt(acct, payouts, txs)
+        first = payouts[0]
+        if all(p.status == FAILED for p in payouts) and is_nonce_error(Exception(first.error)):
+            # Local nonce state was behind the node (e.g. a send from elsewhere); resync and retry once.
+            log.warning("Batch nonce %s rejected for %s (%s); resyncing", first.nonce, acct.address, first.error)
+            await self.wallet.nonces.resync(acct.address)
+            sign_s, send_s = await self._attempt(acct, payouts, txs)
+        failed = [p for p in payouts if p.status == FAILED]
+        for p in reversed(failed):
+            self.wallet.nonces.release(acct.address, p.nonce)
+        if failed:
+            gap = failed[0].nonce
+            for p in payouts:
+                if p.status == SENT and p.nonce > gap:
+                    p.status, p.error = QUEUED, f"waits for nonce {gap}, which the next send from this account reuses"
+        sent = [p for p in payouts if p.status != FAILED]
+        if sent:
+            self.wallet.state_changed()
+        if self.wallet.receipts is not None:
+            for p in sent:
+                self.wallet.receipts.track(p.tx_hash, acct.address, p.nonce, chat_id)
+        log.info("Batch of %d from %s: %d sent, %d failed; signed in %.2fs, broadcast in %.2fs", len(payouts), acct.address, len(sent), len(failed), sign_s, send_s)
+        return sign_s, send_s
@@ -0,0 +1,326 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import Any, List, Optional, Sequence, Tuple
+
+import requests
+from aiohttp import ClientError, ClientSession, ClientTimeout, TCPConnector
+from requests.adapters import HTTPAdapter
+from web3 import AsyncHTTPProvider, HTTPProvider
+from web3.middleware import Web3Middleware
+from web3.providers import JSONBaseProvider
+from web3.providers.async_base import AsyncJSONBaseProvider
+from web3.types import RPCEndpoint, RPCResponse
+
+from .metrics import metrics
+
+log = logging.getLogger(__name__)
+
+# Sent to one pinned endpoint so nonces and pending state stay consistent.
+WRITE_METHODS = {"eth_sendRawTransaction", "eth_sendTransaction", "eth_getTransactionCount"}
+WRITE_PREFIXES = ("anvil_", "evm_", "hardhat_")
+
+ASYNC_TRANSPORT_ERRORS = (ClientError, asyncio.TimeoutError, OSError)
+SYNC_TRANSPORT_ERRORS = (requests.RequestException, OSError)
+
+
+def is_write(method: str) -> bool:
+    return method in WRITE_METHODS or method.startswith(WRITE_PREFIXES)
+
+
+class Endpoint:
+    def __init__(self, url: str, provider: Any):
+        self.url = url
+        self.provider = provider
+        self.latency = 0.0  # EWMA, seconds; 0 so untried endpoints get picked first
+        self.in_flight = 0
+        self.failures = 0
+        self.down_until = 0.0
+        self.height: Optional[int] = None
+
+    @property
+    def healthy(self) -> bool:
+        return self.down_until <= time.monotonic()
+
+    def score(self) -> float:
+        return self.latency * (1 + self.in_flight)
+
+
+class EndpointPool:
+    """Routing and health state shared by the sync and async pooled providers.
+
+    Reads go to the better of two random healthy endpoints by EWMA latency and
+    in-flight count, failing over to the others. Writes stick to one endpoint
+    until a request to it fails. An endpoint that fails ``failure_threshold``
+    times in a row, or lags the best known head by more than ``max_lag``
+    blocks, is skipped for ``cooldown`` seconds.
+    """
+
+    def __init__(self, endpoints: List[Endpoint], failure_threshold: int = 3, cooldown: float = 10.0, max_lag: int = 5):
+        if not endpoints:
+            raise ValueError("At least one RPC endpoint is required")
+        self.endpoints = endpoints
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_lag = max_lag
+        self._writer = 0
+        self._lock = threading.Lock()
+
+    def _healthy(self) -> List[Endpoint]:
+        return [e for e in self.endpoints if e.healthy] or self.endpoints
+
+    def writer(self) -> Endpoint:
+        with self._lock:
+            current = self.endpoints[self._writer]
+            if not current.healthy:
+                for i, e in enumerate(self.endpoints):
+                    if e.healthy:
+                        log.warning("Write endpoint %s is down, pinning writes to %s", current.url, e.url)
+                        self._writer = i
+                        break
+            return self.endpoints[self._writer]
+
+    def candidates(self, method: str) -> List[Endpoint]:
+        """Endpoints to try for method, best first."""
+        if is_write(method):
+            writer = self.writer()
+            return [writer] + [e for e in self._healthy() if e is not writer]
+        healthy = self._healthy()
+        if len(healthy) > 1:
+            a, b = random.sample(healthy, 2)
+            first = a if a.score() <= b.score() else b
+        else:
+            first = healthy[0]
+        return [first] + sorted((e for e in self.endpoints if e is not first), key=Endpoint.score)
+
+    def record(self, endpoint: Endpoint, elapsed: float, ok: bool, method: str = ""):
+        with self._lock:
+            if ok:
+                endpoint.latency = 0.8 * endpoint.latency + 0.2 * elapsed if endpoint.latency else elapsed
+                endpoint.failures = 0
+            else:
+                endpoint.failures += 1
+                # A failed write endpoint is dropped at once so writes re-pin
+                # elsewhere; resending the same signed tx is harmless.
+                if endpoint.failures >= self.failure_threshold or is_write(method):
+                    log.warning("RPC endpoint %s marked down for %.0fs", endpoint.url, self.cooldown)
+                    endpoint.down_until = time.monotonic() + self.cooldown
+
+    def record_height(self, endpoint: Endpoint, height: int):
+        endpoint.height = height
+        best = max(e.height or 0 for e in self.endpoints)
+        for e in self.endpoints:
+            if e.height is not None and best - e.height > self.max_lag:
+                log.warning("RPC endpoint %s is %d blocks behind", e.url, best - e.height)
+                e.down_until = time.monotonic() + self.cooldown
+
+    def batch_method(self, requests_: Sequence[Tuple[RPCEndpoint, Any]]) -> str:
+        # A batch containing any write is routed like a write.
+        return next((m for m, _ in requests_ if is_write(m)), "eth_batch")
+
+
+class AsyncPooledHTTPProvider(AsyncJSONBaseProvider):
+    """AsyncWeb3 provider over several HTTP endpoints with keep-alive pooling and failover."""
+
+    def __init__(self, urls: Sequence[str], pool_size: int = 32, timeout: float = 10.0, health_interval: float = 5.0, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.health_interval = health_interval
+        self.pool = EndpointPool([
+            # Retries are disabled per endpoint; failing over is faster than backing off.
+            Endpoint(url, AsyncHTTPProvider(url, request_kwargs={"timeout": ClientTimeout(total=timeout)}, exception_retry_configuration=None))
+            for url in urls
+        ])
+        self._sessions_ready = False
+        self._sessions_lock = asyncio.Lock()
+        self._health_task: Optional[asyncio.Task] = None
+
+    def __str__(self) -> str:
+        return f"Pooled RPC connection {[e.url for e in self.pool.endpoints]}"
+
+    async def _ensure_sessions(self):
+        # web3's default session closes the connection after every request;
+        # replace it with a keep-alive pool bound to the running loop.
+        if self._sessions_ready:
+            return
+        # The first requests arrive together; only one of them may create the sessions.
+        async with self._sessions_lock:
+            if self._sessions_ready:
+                return
+            for e in self.pool.endpoints:
+                session = ClientSession(
+                    raise_for_status=True,
+                    connector=TCPConnector(limit=self.pool_size, keepalive_timeout=30),
+                    timeout=ClientTimeout(total=self.timeout),
+                )
+                await e.provider.cache_async_session(session)
+            self._sessions_ready = True
+
+    async def _call(self, method: str, fn_name: str, *args: Any) -> Any:
+        await self._ensure_sessions()
+        error: Optional[BaseException] = None
+        for endpoint in self.pool.candidates(method):
+            endpoint.in_flight += 1
+            started = time.monotonic()
+            try:
+                result = await getattr(endpoint.provider, fn_name)(*args)
+            except ASYNC_TRANSPORT_ERRORS as e:
+                self.pool.record(endpoint, time.monotonic() - started, ok=False, method=method)
+                log.info("RPC %s failed on %s: %s", method, endpoint.url, e)
+                error = e
+                continue
+            finally:
+                endpoint.in_flight -= 1
+            self.pool.record(endpoint, time.monotonic() - started, ok=True)
+            return result
+        raise error
+
+    async def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        return await self._call(method, "make_request", method, params)
+
+    async def make_batch_request(self, requests_: List[Tuple[RPCEndpoint, Any]]) -> List[RPCResponse]:
+        return await self._call(self.pool.batch_method(requests_), "make_batch_request", requests_)
+
+    async def check_health(self):
+        await self._ensure_sessions()
+
+        async def probe(endpoint: Endpoint):
+            started = time.monotonic()
+            try:
+                response = await endpoint.provider.make_request(RPCEndpoint("eth_blockNumber"), [])
+                self.pool.record(endpoint, time.monotonic() - started, ok=True)
+                self.pool.record_height(endpoint, int(response["result"], 16))
+            except Exception as e:
+                self.pool.record(endpoint, time.monotonic() - started, ok=False)
+                log.info("Health check failed for %s: %s", endpoint.url, e)
+
+        await asyncio.gather(*(probe(e) for e in self.pool.endpoints))
+
+    async def _health_loop(self):
+        while True:
+            await self.check_health()
+            await asyncio.sleep(self.health_interval)
+
+    def start(self):
+        if self._health_task is None and len(self.pool.endpoints) > 1:
+            self._health_task = asyncio.create_task(self._health_loop(), name="rpc-health")
+
+    async def disconnect(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        for e in self.pool.endpoints:
+            await e.provider.disconnect()
+
+
+class PooledHTTPProvider(JSONBaseProvider):
+    """Sync counterpart of AsyncPooledHTTPProvider for RPC_ASYNC=false."""
+
+    def __init__(self, urls: Sequence[str], pool_size: int = 32, timeout: float = 10.0, **kwargs: Any):
+        super().__init__(**kwargs)
+        endpoints = []
+        for url in urls:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            endpoints.append(Endpoint(url, HTTPProvider(url, request_kwargs={"timeout": timeout}, session=session, exception_retry_configuration=None)))
+        self.pool = EndpointPool(endpoints)
+
+    def __str__(self) -> str:
+        return f"Pooled RPC connection {[e.url for e in self.pool.endpoints]}"
+
+    def _call(self, method: str, fn_name: str, *args: Any) -> Any:
+        error: Optional[BaseException] = None
+        for endpoint in self.pool.candidates(method):
+            endpoint.in_flight += 1
+            started = time.monotonic()
+            try:
+                result = getattr(endpoint.provider, fn_name)(*args)
+            except SYNC_TRANSPORT_ERRORS as e:
+                self.pool.record(endpoint, time.monotonic() - started, ok=False, method=method)
+                log.info("RPC %s failed on %s: %s", method, endpoint.url, e)
+                error = e
+                continue
+            finally:
+                endpoint.in_flight -= 1
+            self.pool.record(endpoint, time.monotonic() - started, ok=True)
+            return result
+        raise error
+
+    def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        return self._call(method, "make_request", method, params)
+
+    def make_batch_request(self, requests_: List[Tuple[RPCEndpoint, Any]]) -> List[RPCResponse]:
+        return self._call(self.pool.batch_method(requests_), "make_batch_request", requests_)
+
+
+class MetricsMiddleware(Web3Middleware):
+    """Records per-method latency and errors for every request made through web3."""
+
+    def _record(self, method: str, started: float, response: Any):
+        metrics.rpc_seconds.observe(time.perf_counter() - started, method)
+        if isinstance(response, dict) and "error" in response:
+            metrics.rpc_errors.inc(method)
+
+    def _record_batch(self, requests_info: List[Tuple[str, Any]], started: float, response: Any):
+        metrics.rpc_seconds.observe(time.perf_counter() - started, "batch")
+        responses = response if isinstance(response, list) else [response] * len(requests_info)
+        for (method, _), r in zip(requests_info, responses):
+            if isinstance(r, dict) and "error" in r:
+                metrics.rpc_errors.inc(method)
+
+    def wrap_make_request(self, make_request):
+        def middleware(method, params):
+            started = time.perf_counter()
+            try:
+                response = make_request(method, params)
+            except Exception:
+                metrics.rpc_errors.inc(method)
+                raise
+            self._record(method, started, response)
+            return response
+
+        return middleware
+
+    def wrap_make_batch_request(self, make_batch_request):
+        def middleware(requests_info):
+            started = time.perf_counter()
+            try:
+                response = make_batch_request(requests_info)
+            except Exception:
+                metrics.rpc_errors.inc("batch")
+                raise
+            self._record_batch(requests_info, started, response)
+            return response
+
+        return middleware
+
+    async def async_wrap_make_request(self, make_request):
+        async def middleware(method, params):
+            started = time.perf_counter()
+            try:
+                response = await make_request(method, params)
+            except Exception:
+                metrics.rpc_errors.inc(method)
+                raise
+            self._record(method, started, response)
+            return response
+
+        return middleware
+
+    async def async_wrap_make_batch_request(self, make_batch_request):
+        async def middleware(requests_info):
+            started = time.perf_counter()
+            try:
+                response = await make_batch_request(requests_info)
+            except Exception:
+                metrics.rpc_errors.inc("batch")
+                raise
+            self._record_batch(requests_info, started, response)
+            return response
+
+        return middleware
@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from .wallet import WalletManager
+
+log = logging.getLogger(__name__)
+
+CONFIRMED = "confirmed"
+REVERTED = "reverted"
+DROPPED = "dropped"
+PENDING = "pending"
+
+
+def _int(v: Any) -> Optional[int]:
+    if v is None:
+        return None
+    return int(v, 16) if isinstance(v, str) else int(v)
+
+
+@dataclass
+class _PendingTx:
+    tx_hash: str
+    sender: Optional[str]
+    nonce: Optional[int]
+    chats: Set[int] = field(default_factory=set)
+    # Head when the tx was first checked; drop detection counts blocks from here.
+    since_block: Optional[int] = None
+    sent_at: float = field(default_factory=time.monotonic)
+
+
+class ReceiptTracker:
+    """Follows broadcast transactions until they are mined, reverted or dropped.
+
+    One poller serves every outstanding hash: whenever the head advances, all
+    receipts are fetched in a single JSON-RPC batch. A tx still without a
+    receipt ``drop_after_blocks`` blocks later is looked up by hash, and
+    reported dropped if the node no longer knows it. Outcomes are pushed to
+    the chats that asked via ``notify`` and the last ``retention`` of them
+    are kept for ``status``.
+    """
+
+    def __init__(self, wallet: WalletManager, poll_interval: float = 1.0, drop_after_blocks: int = 50, max_pending: int = 10000, retention: int = 1000):
+        self.wallet = wallet
+        self.poll_interval = poll_interval
+        self.drop_after_blocks = drop_after_blocks
+        self.max_pending = max_pending
+        self.retention = retention
+        self.notify: Optional[Callable[[int, str], Awaitable[Any]]] = None
+        self._pending: "OrderedDict[str, _PendingTx]" = OrderedDict()
+        self._done: "OrderedDict[str, Tuple[str, Optional[int]]]" = OrderedDict()
+        self._head: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        # Late notifications from track(); the loop only keeps weak references to tasks.
+        self._notifications: Set[asyncio.Task] = set()
+        self.counts: Dict[str, int] = {CONFIRMED: 0, REVERTED: 0, DROPPED: 0}
+
+    def track(self, tx_hash: str, sender: Optional[str] = None, nonce: Optional[int] = None, chat_id: Optional[int] = None):
+        """Starts following tx_hash; calling it again for the same hash adds chat_id to the recipients."""
+        tx_hash = tx_hash.lower()
+        if not tx_hash.startswith("0x"):
+            tx_hash = "0x" + tx_hash
+        done = self._done.get(tx_hash)
+        if done is not None:
+            # Settled before this chat subscribed (e.g. the faucet handler
+            # attaching after the dispenser); report right away.
+            if chat_id is not None:
+                task = asyncio.ensure_future(self._notify({chat_id}, tx_hash, *done))
+                self._notifications.add(task)
+                task.add_done_callback(self._notifications.discard)
+            return
+        entry = self._pending.get(tx_hash)
+        if entry is None:
+            entry = self._pending[tx_hash] = _PendingTx(tx_hash, sender, nonce)
+            while len(self._pending) > self.max_pending:
+                dropped, _ = self._pending.popitem(last=False)
+                log.warning("Receipt tracker full, no longer following %s", dropped)
+        elif sender is not None and entry.sender is None:
+            entry.sender, entry.nonce = sender, nonce
+        if chat_id is not None:
+            entry.chats.add(chat_id)
+
+    def pending_count(self, chat_id: Optional[int] = None) -> int:
+        if chat_id is None:
+            return len(self._pending)
+        return sum(1 for e in self._pending.values() if chat_id in e.chats)
+
+    def status(self, tx_hash: str) -> Optional[Tuple[str, Optional[int]]]:
+        """Returns (status, block number) for a tracked or recently settled hash."""
+        tx_hash = tx_hash.lower()
+        if tx_hash in self._pending:
+            return PENDING, None
+        return self._done.get(tx_hash)
+
+    def stats(self) -> Dict[str, int]:
+        return {PENDING: len(self._pending), **self.counts}
+
+    async def _notify(self, chats: Set[int], tx_hash: str, status: str, block: Optional[int]):
+        if self.notify is None or not chats:
+            return
+        if status == CONFIRMED:
+            text = f"✅ Tx {tx_hash} confirmed in block {block}"
+        elif status == REVERTED:
+            text = f"❌ Tx {tx_hash} reverted in block {block}"
+        else:
+            text = f"⚠️ Tx {tx_hash} was dropped without being mined"
+        results = await asyncio.gather(*(self.notify(c, text) for c in chats), return_exceptions=True)
+        for chat_id, res in zip(chats, results):
+            if isinstance(res, Exception):
+                log.info("Could not notify chat %s about %s: %s", chat_id, tx_hash, res)
+
+    def _settle(self, entry: _PendingTx, status: str, block: Optional[int]):
+        del self._pending[entry.tx_hash]
+        self._done[entry.tx_hash] = (status, block)
+        while len(self._done) > self.retention:
+            self._done.popitem(last=False)
+        self.counts[status] += 1
+        if entry.sender is not None and entry.nonce is not None:
+            if status == DROPPED:
+                self.wallet.nonces.release(entry.sender, entry.nonce)
+            else:
+                self.wallet.nonces.confirm(entry.sender, entry.nonce)
+
+    async def check_once(self) -> int:
+        """Checks all pending hashes if the head moved; returns how many settled."""
+        head = await self.wallet.block_number()
+        if head == self._head or not self._pending:
+            self._head = head
+            return 0
+        self._head = head
+        entries = list(self._pending.values())
+        receipts = await self.wallet.raw_batch("eth_getTransactionReceipt", [[e.tx_hash] for e in entries])
+        settled: List[Tuple[_PendingTx, str, Optional[int]]] = []
+        overdue: List[_PendingTx] = []
+        for entry, receipt in zip(entries, receipts):
+            if receipt is not None:
+                # Pre-Byzantium receipts carry no status; treat them as success.
+                ok = _int(receipt.get("status", 1)) == 1
+                settled.append((entry, CONFIRMED if ok else REVERTED, _int(receipt.get("blockNumber"))))
+            elif entry.since_block is None:
+                entry.since_block = head
+            elif head - entry.since_block >= self.drop_after_blocks:
+                overdue.append(entry)
+        if overdue:
+            txs = await self.wallet.raw_batch("eth_getTransactionByHash", [[e.tx_hash] for e in overdue])
+            for entry, tx in zip(overdue, txs):
+                if tx is None:
+                    settled.append((entry, DROPPED, None))
+                else:
+                    # Still in the mempool; give it another window.
+                    entry.since_block = head
+        for entry, status, block in settled:
+            if entry.tx_hash in self._pending:
+                self._settle(entry, status, block)
+        if settled:
+            await asyncio.gather(*(self._notify(e.chats, e.tx_hash, s, b) for e, s, b in settled))
+        return len(settled)
+
+    async def run(self):
+        while True:
+            try:
+                await self.check_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("Receipt check failed")
+            await asyncio.sleep(self.poll_interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run(), name="receipt-tracker")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for task in list(self._notifications):
+            task.cancel()
+        await asyncio.gather(*self._notifications, return_exceptions=True)
@@ -0,0 +1,173 @@
+import asyncio
+import csv
+import io
+import logging
+import multiprocessing
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Sequence, Tuple
+
+from eth_account import Account
+from eth_account.messages import defunct_hash_message, encode_defunct
+from eth_utils import to_bytes, to_checksum_address
+
+log = logging.getLogger(__name__)
+
+VERIFY_HEADER = ["address", "message", "signature", "recovered", "valid", "error"]
+SIGN_HEADER = ["message", "signature", "address"]
+
+
+# Module-level so they can be pickled into the process pool.
+def _recover_chunk(rows: Sequence[Tuple[str, str]]) -> List[Tuple[Optional[str], Optional[str]]]:
+    """(message, signature) -> (recovered address, error) for each row."""
+    out = []
+    for message, signature in rows:
+        try:
+            out.append((Account.recover_message(encode_defunct(text=message), signature=signature), None))
+        except Exception as e:
+            out.append((None, str(e) or type(e).__name__))
+    return out
+
+
+def _sign_chunk(key: bytes, messages: Sequence[str]) -> List[str]:
+    acct = Account.from_key(key)
+    return ["0x" + acct.sign_message(encode_defunct(text=m)).signature.hex().removeprefix("0x") for m in messages]
+
+
+def _sign_tx_chunk(key: bytes, txs: Sequence[dict]) -> List[Tuple[bytes, str]]:
+    """(raw transaction, tx hash) for each transaction dict."""
+    acct = Account.from_key(key)
+    out = []
+    for tx in txs:
+        signed = acct.sign_transaction(tx)
+        raw = getattr(signed, "raw_transaction", None) or signed.rawTransaction
+        out.append((bytes(raw), "0x" + bytes(signed.hash).hex()))
+    return out
+
+
+def parse_verify_rows(data: bytes, max_rows: int) -> List[Tuple[str, str, str]]:
+    """Reads address,message,signature CSV rows; a leading header row is skipped."""
+    rows = []
+    for i, row in enumerate(csv.reader(io.StringIO(data.decode("utf-8-sig")))):
+        if not row or all(not c.strip() for c in row):
+            continue
+        if i == 0 and row[0].strip().lower() == "address":
+            continue
+        if len(row) < 3:
+            raise ValueError(f"Line {i + 1}: expected address,message,signature")
+        rows.append((row[0].strip(), row[1], row[2].strip()))
+        if len(rows) > max_rows:
+            raise ValueError(f"Too many rows (max {max_rows})")
+    return rows
+
+
+def parse_messages(data: bytes, max_rows: int) -> List[str]:
+    """One message per non-empty line."""
+    messages = [line for line in data.decode("utf-8-sig").splitlines() if line.strip()]
+    if len(messages) > max_rows:
+        raise ValueError(f"Too many messages (max {max_rows})")
+    return messages
+
+
+def to_csv(header: Sequence[str], rows: Sequence[Sequence]) -> bytes:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(header)
+    writer.writerows(rows)
+    return buf.getvalue().encode("utf-8")
+
+
+class BulkSigner:
+    """Signs messages and transactions and verifies EIP-191 signatures in bulk on a process pool.
+
+    Work is split into ``chunk_size`` pieces so one pickle round trip covers
+    many signatures. Recovered signers are cached by (message hash, signature)
+    so re-verifying the same file only pays for the rows that changed.
+    """
+
+    def __init__(self, workers: Optional[int] = None, chunk_size: int = 200, cache_size: int = 100000):
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.cache_size = cache_size
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._cache: "OrderedDict[Tuple[bytes, bytes], str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: forking a process that already runs threads can deadlock.
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def _chunks(self, items: Sequence) -> List[Sequence]:
+        return [items[i:i + self.chunk_size] for i in range(0, len(items), self.chunk_size)]
+
+    @staticmethod
+    def _cache_key(message: str, signature: str) -> Optional[Tuple[bytes, bytes]]:
+        try:
+            return bytes(defunct_hash_message(text=message)), to_bytes(hexstr=signature)
+        except Exception:
+            return None
+
+    async def recover(self, pairs: Sequence[Tuple[str, str]]) -> List[Tuple[Optional[str], Optional[str]]]:
+        """(message, signature) -> (recovered address, error), in input order."""
+        results: List[Optional[Tuple[Optional[str], Optional[str]]]] = [None] * len(pairs)
+        keys = [self._cache_key(m, s) for m, s in pairs]
+        missing = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                hit = self._cache.get(key) if key is not None else None
+                if hit is not None:
+                    self._cache.move_to_end(key)
+                    results[i] = (hit, None)
+                else:
+                    missing.append(i)
+        if missing:
+            loop = asyncio.get_running_loop()
+            todo = [pairs[i] for i in missing]
+            chunks = await asyncio.gather(*(
+                loop.run_in_executor(self._executor(), _recover_chunk, chunk) for chunk in self._chunks(todo)
+            ))
+            recovered = [r for chunk in chunks for r in chunk]
+            with self._lock:
+                for i, res in zip(missing, recovered):
+                    results[i] = res
+                    if res[0] is not None and keys[i] is not None:
+                        self._cache[keys[i]] = res[0]
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            log.info("Recovered %d signatures (%d cached)", len(missing), len(pairs) - len(missing))
+        return results
+
+    async def verify(self, rows: Sequence[Tuple[str, str, str]]) -> List[Tuple[str, str, str, str, bool, str]]:
+        recovered = await self.recover([(m, s) for _, m, s in rows])
+        out = []
+        for (addr, message, signature), (signer, error) in zip(rows, recovered):
+            valid = False
+            if signer is not None:
+                try:
+                    valid = to_checksum_address(addr) == signer
+                except Exception:
+                    error = "invalid address"
+            out.append((addr, message, signature, signer or "", valid, error or ""))
+        return out
+
+    async def sign(self, key: bytes, messages: Sequence[str]) -> List[str]:
+        loop = asyncio.get_running_loop()
+        chunks = await asyncio.gather(*(
+            loop.run_in_executor(self._executor(), _sign_chunk, key, chunk) for chunk in self._chunks(messages)
+        ))
+        return [sig for chunk in chunks for sig in chunk]
+
+    async def sign_transactions(self, key: bytes, txs: Sequence[dict]) -> List[Tuple[bytes, str]]:
+        loop = asyncio.get_running_loop()
+        chunks = await asyncio.gather(*(
+            loop.run_in_executor(self._executor(), _sign_tx_chunk, key, chunk) for chunk in self._chunks(txs)
+        ))
+        return [signed for chunk in chunks for signed in chunk]
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,25 @@
+import time
+from typing import List, Tuple
+
+from .metrics import metrics
+
+
+class StartupReport:
+    """Records how long after ``started`` each startup phase finished.
+
+    Phases are also exported as etm_startup_seconds so cold starts can be
+    compared across restarts.
+    """
+
+    def __init__(self, started: float):
+        self.started = started
+        self.phases: List[Tuple[str, float]] = []
+
+    def mark(self, phase: str) -> float:
+        elapsed = time.perf_counter() - self.started
+        self.phases.append((phase, elapsed))
+        metrics.startup_seconds.set(elapsed, phase)
+        return elapsed
+
+    def summary(self) -> str:
+        return ", ".join(f"{phase} {elapsed:.2f}s" for phase, elapsed in self.phases)
@@ -1,28 +1,71 @@
+import asyncio
+import contextlib
+import functools
 import json
+import os
+import sqlite3
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, Callable, Iterator, Optional, TypeVar
 
+from .metrics import metrics
+
+T = TypeVar("T")
+
+# Created by the storage and index constructors rather than on import.
 BASE = Path.cwd() / "nuclear-codes"
-BASE.mkdir(exist_ok=True)
 
 USERS_FILE = BASE / "users.json"
 TOKENS_FILE = BASE / "tokens.json"
+STATE_FILE = BASE / "state.sqlite3"
+
+STATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    idx INTEGER NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS tokens (
+    chat_id TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    info TEXT NOT NULL,
+    PRIMARY KEY (chat_id, symbol)
+);
+"""
+
+
+def atomic_write_json(path: Path, data, indent: Optional[int] = None):
+    # Write to a sibling temp file and rename it over the target so readers
+    # never see a half-written file.
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=indent, separators=None if indent else (",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
 
 
 class JSONStorage:
     def __init__(self, users_path: Path = USERS_FILE, tokens_path: Path = TOKENS_FILE):
         self.users_path = users_path
         self.tokens_path = tokens_path
+        for path in {users_path.parent, tokens_path.parent}:
+            path.mkdir(parents=True, exist_ok=True)
 
     def _load(self, path: Path, default):
         if not path.exists():
             return default
-        with path.open("r", encoding="utf-8") as f:
+        with metrics.timer("storage_load"), path.open("r", encoding="utf-8") as f:
             return json.load(f)
 
     def _save(self, path: Path, data):
-        with path.open("w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2)
+        with metrics.timer("storage_save"):
+            atomic_write_json(path, data, indent=2)
 
     def get_users(self) -> Dict[str, int]:
         return self._load(self.users_path, {})
@@ -36,3 +79,219 @@ class JSONStorage:
     def save_tokens(self, tokens: Dict[str, Dict[str, Any]]):
         self._save(self.tokens_path, tokens)
 
+    def get_or_assign_index(self, user_id: int) -> int:
+        users = self.get_users()
+        key = str(user_id)
+        if key not in users:
+            users[key] = len(users)
+            self.save_users(users)
+        return int(users[key])
+
+    def get_chat_tokens(self, chat_id: int) -> Dict[str, Dict[str, Any]]:
+        return self.get_tokens().get(str(chat_id), {})
+
+    def set_chat_token(self, chat_id: int, symbol: str, info: Dict[str, Any]):
+        tokens = self.get_tokens()
+        tokens.setdefault(str(chat_id), {})[symbol] = info
+        self.save_tokens(tokens)
+
+    async def run_sync(self, fn: Callable[..., T], *args) -> T:
+        """Calls one of the storage methods from a handler."""
+        return fn(*args)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class MemoryStorage(JSONStorage):
+    """JSONStorage that keeps users and tokens in memory and writes behind.
+
+    Files are read once. Changes mark the data dirty and a single timer flushes
+    everything that changed within ``flush_interval`` seconds in one atomic
+    write per file, so bursts of commands cost one write instead of one each.
+    """
+
+    def __init__(self, users_path: Path = USERS_FILE, tokens_path: Path = TOKENS_FILE, flush_interval: float = 1.0):
+        super().__init__(users_path, tokens_path)
+        self.flush_interval = flush_interval
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._users: Dict[str, int] = self._load(users_path, {})
+        self._tokens: Dict[str, Dict[str, Any]] = self._load(tokens_path, {})
+        self._dirty: set = set()
+        self._timer: Optional[threading.Timer] = None
+
+    def _mark_dirty(self, path: Path):
+        with self._lock:
+            self._dirty.add(path)
+            if self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        # _flush_lock keeps snapshots and their writes in the same order.
+        with self._flush_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                dirty, self._dirty = self._dirty, set()
+                snapshots = {}
+                if self.users_path in dirty:
+                    snapshots[self.users_path] = dict(self._users)
+                if self.tokens_path in dirty:
+                    snapshots[self.tokens_path] = {chat: dict(reg) for chat, reg in self._tokens.items()}
+            for path, data in snapshots.items():
+                with metrics.timer("storage_save"):
+                    atomic_write_json(path, data)
+
+    def close(self):
+        self.flush()
+
+    def get_users(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._users)
+
+    def save_users(self, users: Dict[str, int]):
+        with self._lock:
+            self._users = dict(users)
+        self._mark_dirty(self.users_path)
+
+    def get_tokens(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {chat: dict(reg) for chat, reg in self._tokens.items()}
+
+    def save_tokens(self, tokens: Dict[str, Dict[str, Any]]):
+        with self._lock:
+            self._tokens = {chat: dict(reg) for chat, reg in tokens.items()}
+        self._mark_dirty(self.tokens_path)
+
+    def get_or_assign_index(self, user_id: int) -> int:
+        key = str(user_id)
+        with self._lock:
+            idx = self._users.get(key)
+            if idx is not None:
+                return int(idx)
+            idx = self._users[key] = len(self._users)
+        self._mark_dirty(self.users_path)
+        return idx
+
+    def get_chat_tokens(self, chat_id: int) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return dict(self._tokens.get(str(chat_id), {}))
+
+    def set_chat_token(self, chat_id: int, symbol: str, info: Dict[str, Any]):
+        with self._lock:
+            self._tokens.setdefault(str(chat_id), {})[symbol] = info
+        self._mark_dirty(self.tokens_path)
+
+
+class SQLiteStorage(JSONStorage):
+    """Users and tokens in one SQLite database that several processes can share.
+
+    Every read goes to the database, so a token added through one worker is
+    seen by the others right away. Index assignment runs in a ``BEGIN
+    IMMEDIATE`` transaction, which takes the write lock before reading the
+    highest index, so two processes can never hand out the same one. On
+    first use the tables are filled from existing users.json/tokens.json.
+
+    A call can wait up to ``busy_timeout`` for another worker's write lock,
+    so ``run_sync`` runs it on a thread of its own instead of the event loop.
+    """
+
+    def __init__(self, path: Path = STATE_FILE, users_path: Path = USERS_FILE, tokens_path: Path = TOKENS_FILE, busy_timeout: float = 10.0):
+        super().__init__(users_path, tokens_path)
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Autocommit mode; transactions are opened explicitly where they matter.
+        self._conn = sqlite3.connect(path, timeout=busy_timeout, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(STATE_SCHEMA)
+        self._lock = threading.Lock()
+        # One thread: calls share the connection and are serialized by _lock anyway.
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="sqlite-storage")
+        self._import_json()
+
+    @contextlib.contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self._conn
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def _import_json(self):
+        with self._lock, self._transaction() as conn:
+            if conn.execute("SELECT 1 FROM users LIMIT 1").fetchone() or conn.execute("SELECT 1 FROM tokens LIMIT 1").fetchone():
+                return
+            users = self._load(self.users_path, {})
+            tokens = self._load(self.tokens_path, {})
+            conn.executemany("INSERT INTO users (user_id, idx) VALUES (?, ?)", ((k, int(v)) for k, v in users.items()))
+            conn.executemany(
+                "INSERT INTO tokens (chat_id, symbol, info) VALUES (?, ?, ?)",
+                ((chat, symbol, json.dumps(info)) for chat, reg in tokens.items() for symbol, info in reg.items()),
+            )
+
+    def get_users(self) -> Dict[str, int]:
+        with self._lock, metrics.timer("storage_load"):
+            return dict(self._conn.execute("SELECT user_id, idx FROM users").fetchall())
+
+    def save_users(self, users: Dict[str, int]):
+        with self._lock, metrics.timer("storage_save"), self._transaction() as conn:
+            conn.executemany("INSERT OR REPLACE INTO users (user_id, idx) VALUES (?, ?)", ((k, int(v)) for k, v in users.items()))
+
+    def get_tokens(self) -> Dict[str, Dict[str, Any]]:
+        tokens: Dict[str, Dict[str, Any]] = {}
+        with self._lock, metrics.timer("storage_load"):
+            rows = self._conn.execute("SELECT chat_id, symbol, info FROM tokens").fetchall()
+        for chat, symbol, info in rows:
+            tokens.setdefault(chat, {})[symbol] = json.loads(info)
+        return tokens
+
+    def save_tokens(self, tokens: Dict[str, Dict[str, Any]]):
+        with self._lock, metrics.timer("storage_save"), self._transaction() as conn:
+            conn.execute("DELETE FROM tokens")
+            conn.executemany(
+                "INSERT INTO tokens (chat_id, symbol, info) VALUES (?, ?, ?)",
+                ((chat, symbol, json.dumps(info)) for chat, reg in tokens.items() for symbol, info in reg.items()),
+            )
+
+    def get_or_assign_index(self, user_id: int) -> int:
+        key = str(user_id)
+        with self._lock:
+            row = self._conn.execute("SELECT idx FROM users WHERE user_id = ?", (key,)).fetchone()
+            if row is not None:
+                return row[0]
+            with metrics.timer("storage_save"), self._transaction() as conn:
+                # Re-read under the write lock: another process may have just registered this user.
+                row = conn.execute("SELECT idx FROM users WHERE user_id = ?", (key,)).fetchone()
+                if row is not None:
+                    return row[0]
+                idx = conn.execute("SELECT COALESCE(MAX(idx) + 1, 0) FROM users").fetchone()[0]
+                conn.execute("INSERT INTO users (user_id, idx) VALUES (?, ?)", (key, idx))
+                return idx
+
+    def get_chat_tokens(self, chat_id: int) -> Dict[str, Dict[str, Any]]:
+        with self._lock, metrics.timer("storage_load"):
+            rows = self._conn.execute("SELECT symbol, info FROM tokens WHERE chat_id = ?", (str(chat_id),)).fetchall()
+        return {symbol: json.loads(info) for symbol, info in rows}
+
+    def set_chat_token(self, chat_id: int, symbol: str, info: Dict[str, Any]):
+        with self._lock, metrics.timer("storage_save"):
+            self._conn.execute("INSERT OR REPLACE INTO tokens (chat_id, symbol, info) VALUES (?, ?, ?)", (str(chat_id), symbol, json.dumps(info)))
+
+    async def run_sync(self, fn: Callable[..., T], *args) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args))
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,92 @@
+import asyncio
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+from eth_abi import encode
+from eth_utils import function_signature_to_4byte_selector
+from web3 import Web3
+
+from .storage import JSONStorage
+from .wallet import WalletManager
+
+log = logging.getLogger(__name__)
+
+ERC20_ABI = [
+    {"name": "balanceOf", "inputs": [{"name": "", "type": "address"}], "outputs": [{"name": "", "type": "uint256"}], "stateMutability": "view", "type": "function"},
+    {"name": "decimals", "inputs": [], "outputs": [{"name": "", "type": "uint8"}], "stateMutability": "view", "type": "function"},
+    {"name": "symbol", "inputs": [], "outputs": [{"name": "", "type": "string"}], "stateMutability": "view", "type": "function"},
+    {"name": "transfer", "inputs": [{"name": "to", "type": "address"}, {"name": "value", "type": "uint256"}], "outputs": [{"name": "", "type": "bool"}], "stateMutability": "nonpayable", "type": "function"},
+]
+
+BALANCE_OF_SELECTOR = function_signature_to_4byte_selector("balanceOf(address)")
+DECIMALS_SELECTOR = function_signature_to_4byte_selector("decimals()")
+SYMBOL_SELECTOR = function_signature_to_4byte_selector("symbol()")
+TRANSFER_SELECTOR = function_signature_to_4byte_selector("transfer(address,uint256)")
+
+
+def encode_transfer(to: str, value: int) -> bytes:
+    return TRANSFER_SELECTOR + encode(["address", "uint256"], [Web3.to_checksum_address(to), value])
+
+
+class TokenMetadata:
+    """Prebuilt ERC-20 contract objects and decimals/symbol resolved once per address.
+
+    Metadata read from chain is cached per address for the process and
+    written back into the registry entry that was used (one chat and
+    symbol), so later commands for that entry skip the eth_calls after a
+    restart too. Other chats tracking the same address store theirs on
+    first use.
+    """
+
+    def __init__(self, wallet: WalletManager, storage: JSONStorage):
+        self.wallet = wallet
+        self.storage = storage
+        self._contracts: Dict[str, Any] = {}
+        self._meta: Dict[str, Tuple[int, Optional[str]]] = {}
+
+    def contract(self, address: str):
+        address = Web3.to_checksum_address(address)
+        c = self._contracts.get(address)
+        if c is None:
+            c = self._contracts[address] = self.wallet.contract(address, ERC20_ABI)
+        return c
+
+    async def _fetch_meta(self, address: str) -> Tuple[int, Optional[str]]:
+        c = self.contract(address)
+        decimals, symbol = await asyncio.gather(
+            self.wallet.call(c.functions.decimals()),
+            self.wallet.call(c.functions.symbol()),
+            return_exceptions=True,
+        )
+        if isinstance(decimals, Exception):
+            raise decimals
+        if isinstance(symbol, Exception):
+            # Some old tokens return bytes32 or have no symbol(); decimals is what matters.
+            log.info("symbol() failed for %s: %s", address, symbol)
+            symbol = None
+        return int(decimals), symbol
+
+    async def metadata(self, address: str) -> Tuple[int, Optional[str]]:
+        address = Web3.to_checksum_address(address)
+        meta = self._meta.get(address)
+        if meta is None:
+            meta = self._meta[address] = await self._fetch_meta(address)
+        return meta
+
+    def cached_decimals(self, address: str) -> Optional[int]:
+        meta = self._meta.get(Web3.to_checksum_address(address))
+        return meta[0] if meta else None
+
+    async def decimals(self, chat_id: int, symbol: str, info: Dict[str, Any]) -> int:
+        if info.get("decimals") is not None:
+            return int(info["decimals"])
+        decimals, onchain_symbol = await self.metadata(info["address"])
+        await self.storage.run_sync(self.storage.set_chat_token, chat_id, symbol, {**info, "decimals": decimals, "symbol": onchain_symbol})
+        return decimals
+
+    async def balance_of(self, token: str, owner: str) -> int:
+        fn = self.contract(token).functions.balanceOf(owner)
+        if self.wallet.cache is None:
+            return await self.wallet.call(fn)
+        key = (Web3.to_checksum_address(token), Web3.to_checksum_address(owner))
+        return await self.wallet.cache.get("balance_of", key, lambda block: self.wallet.rpc(fn.call, block_identifier=block))
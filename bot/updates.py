@@ -0,0 +1,68 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Awaitable, Deque, Dict, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+log = logging.getLogger(__name__)
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Processes up to ``max_concurrent_updates`` updates at once, one at a time per user.
+
+    Updates from different users run in parallel; updates from the same user
+    (or, without a user, the same chat) keep their arrival order, so a user's
+    ConversationHandler steps never race each other.
+
+    PTB takes a concurrency slot before calling ``do_process_update``. An
+    update for a user who already has one running is therefore queued and its
+    slot freed at once; the running update's task works through the queue.
+    A user sending a burst holds one slot, not one per waiting update.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        # key -> updates waiting behind the one being processed
+        self._queues: Dict[int, Deque[Awaitable]] = {}
+
+    @staticmethod
+    def _key(update: object) -> Optional[int]:
+        if not isinstance(update, Update):
+            return None
+        if update.effective_user is not None:
+            return update.effective_user.id
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        return None
+
+    async def do_process_update(self, update: object, coroutine: Awaitable) -> None:
+        key = self._key(update)
+        if key is None:
+            await coroutine
+            return
+        waiting = self._queues.get(key)
+        if waiting is not None:
+            waiting.append(coroutine)
+            return
+        waiting = self._queues[key] = deque([coroutine])
+        try:
+            while waiting:
+                try:
+                    await waiting.popleft()
+                except Exception:
+                    # Application.process_update reports handler errors itself; keep draining.
+                    log.exception("Processing an update for %s failed", key)
+        except asyncio.CancelledError:
+            for coro in waiting:
+                coro.close()
+            raise
+        finally:
+            del self._queues[key]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
@@ -1,79 +1,360 @@
+import asyncio
+import contextlib
+import functools
+import logging
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Executor, ThreadPoolExecutor
 from decimal import Decimal, ROUND_DOWN
-from typing import Optional
+from itertools import islice, repeat
+from typing import Any, AsyncIterator, Callable, Deque, Iterable, List, Optional, Sequence, Tuple, TypeVar, Union
 
-from web3 import Web3
+from web3 import AsyncWeb3, Web3
+from web3.exceptions import Web3TypeError
 from web3.types import TxParams
 from eth_account import Account
+from eth_account.hdaccount import seed_from_mnemonic
+from eth_account.hdaccount._utils import hmac_sha512
+from eth_account.hdaccount.deterministic import Node, SoftNode, derive_child_key
 from eth_account.signers.local import LocalAccount
 
+from .fees import FeeOracle
+from .metrics import metrics
+from .nonces import NonceManager, is_already_known, is_nonce_error
+
+BIP44_ETH_PARENT = "m/44'/60'/0'/0"
+
+T = TypeVar("T")
+
+log = logging.getLogger(__name__)
+
+
+def _derive_child_key(parent_key: bytes, chain_code: bytes, index: int) -> bytes:
+    # Module-level so it can be pickled into a ProcessPoolExecutor.
+    key, _ = derive_child_key(parent_key, chain_code, SoftNode(index))
+    return key
+
+
+class HDDeriver:
+    """Derives m/44'/60'/0'/0/<index> accounts from a single mnemonic.
+
+    The PBKDF2 seed stretch and the hardened part of the path are computed once;
+    each index then costs a single soft-child step, and results are kept in a
+    bounded LRU.
+    """
+
+    def __init__(self, mnemonic: str, parent_path: str = BIP44_ETH_PARENT, cache_size: int = 1024):
+        seed = seed_from_mnemonic(mnemonic, "")
+        master = hmac_sha512(b"Bitcoin seed", seed)
+        key, chain_code = master[:32], master[32:]
+        for part in parent_path.split("/")[1:]:
+            key, chain_code = derive_child_key(key, chain_code, Node.decode(part))
+        self._parent_key = key
+        self._chain_code = chain_code
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[int, LocalAccount]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def cached(self, index: int) -> Optional[LocalAccount]:
+        with self._lock:
+            acct = self._cache.get(index)
+            if acct is not None:
+                self._cache.move_to_end(index)
+            return acct
+
+    def _remember(self, index: int, acct: LocalAccount):
+        if self.cache_size <= 0:
+            return
+        with self._lock:
+            self._cache[index] = acct
+            self._cache.move_to_end(index)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def derive(self, index: int) -> LocalAccount:
+        acct = self.cached(index)
+        if acct is None:
+            acct = Account.from_key(_derive_child_key(self._parent_key, self._chain_code, index))
+            self._remember(index, acct)
+        return acct
+
+    def derive_many(self, indices: Iterable[int], executor: Optional[Executor] = None) -> List[LocalAccount]:
+        indices = list(indices)
+        found = {i: a for i in indices if (a := self.cached(i)) is not None}
+        missing = [i for i in dict.fromkeys(indices) if i not in found]
+        if missing:
+            if executor is None:
+                keys = [_derive_child_key(self._parent_key, self._chain_code, i) for i in missing]
+            else:
+                keys = list(executor.map(_derive_child_key, repeat(self._parent_key), repeat(self._chain_code), missing))
+            for i, key in zip(missing, keys):
+                acct = Account.from_key(key)
+                self._remember(i, acct)
+                found[i] = acct
+        return [found[i] for i in indices]
+
+
+def raw_transaction(signed) -> bytes:
+    raw = None
+    if hasattr(signed, "rawTransaction"):
+        raw = getattr(signed, "rawTransaction")
+    elif hasattr(signed, "raw_transaction"):
+        raw = getattr(signed, "raw_transaction")
+    else:
+        try:
+            raw = signed["rawTransaction"]
+        except Exception:
+            raw = None
+    if raw is None:
+        raise RuntimeError("Could not find raw transaction bytes on signed transaction (version mismatch)")
+    return raw
+
 
 class WalletManager:
-    def __init__(self, w3: Web3, mnemonic: str, chain_id: int, gas_price_gwei: Optional[str] = None, faucet_pk: Optional[str] = None):
+    """Wallet operations on top of either a ``Web3`` or an ``AsyncWeb3`` instance.
+
+    All chain-facing methods are coroutines. With ``AsyncWeb3`` the RPC calls are
+    awaited directly; with a sync ``Web3`` they, like signing and key derivation,
+    run on a bounded thread pool so the event loop never blocks.
+    """
+
+    def __init__(self, w3: Union[Web3, AsyncWeb3], mnemonic: str, chain_id: int, gas_price_gwei: Optional[str] = None, faucet_pk: Optional[str] = None, derivation_cache_size: int = 1024, executor_workers: int = 8, scan_batch_size: int = 100, scan_max_in_flight: int = 4, fee_mode: str = "auto", fee_cache_seconds: float = 2.0):
         self.w3 = w3
+        self.is_async = isinstance(w3, AsyncWeb3)
         self.mnemonic = mnemonic
         self.chain_id = chain_id
         self.gas_price_gwei = gas_price_gwei
         self.faucet_pk = faucet_pk
+        self.faucet_account: Optional[LocalAccount] = Account.from_key(faucet_pk) if faucet_pk else None
         Account.enable_unaudited_hdwallet_features()
+        self.deriver = HDDeriver(mnemonic, cache_size=derivation_cache_size)
+        self.executor = ThreadPoolExecutor(max_workers=executor_workers, thread_name_prefix="wallet")
+        self.scan_batch_size = scan_batch_size
+        self.scan_max_in_flight = scan_max_in_flight
+        self.batch_supported = True
+        self._is_anvil: Optional[bool] = None
+        self.nonces = NonceManager(self._pending_nonce)
+        # Set to a ReceiptTracker to have every broadcast followed up.
+        self.receipts = None
+        # Set to a BlockCache to serve balances and the head from a per-block cache.
+        self.cache = None
+        fixed_price = self._gwei_to_wei(Decimal(gas_price_gwei)) if gas_price_gwei else None
+        self.fees = FeeOracle(self, ttl=fee_cache_seconds, mode=fee_mode, fixed_gas_price_wei=fixed_price)
+
+    async def run_sync(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+
+    async def rpc(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        if self.is_async:
+            return await fn(*args, **kwargs)
+        return await self.run_sync(fn, *args, **kwargs)
+
+    async def is_connected(self) -> bool:
+        return await self.rpc(self.w3.is_connected)
 
     def derive_account(self, user_id: int) -> LocalAccount:
-        index = user_id 
-        path = f"m/44'/60'/0'/0/{index}"
-        acct = Account.from_mnemonic(self.mnemonic, account_path=path)
+        return self.deriver.derive(user_id)
+
+    def derive_many(self, indices: Iterable[int], executor: Optional[Executor] = None) -> List[LocalAccount]:
+        return self.deriver.derive_many(indices, executor=executor)
+
+    async def account(self, index: int) -> LocalAccount:
+        acct = self.deriver.cached(index)
+        if acct is None:
+            with metrics.timer("derive"):
+                acct = await self.run_sync(self.deriver.derive, index)
         return acct
 
-    def get_balance(self, address: str) -> Decimal:
+    async def block_number(self) -> int:
+        if self.cache is not None:
+            return await self.cache.block_number()
+        return await self.fetch_block_number()
+
+    async def fetch_block_number(self) -> int:
+        """eth_blockNumber, bypassing the cache."""
+        if self.is_async:
+            return await self.w3.eth.block_number
+        return await self.run_sync(lambda: self.w3.eth.block_number)
+
+    async def is_anvil(self) -> bool:
+        if self._is_anvil is None:
+            version = await self.rpc(self.w3.provider.make_request, "web3_clientVersion", [])
+            self._is_anvil = str(version.get("result", "")).lower().startswith("anvil")
+        return self._is_anvil
+
+    async def get_block(self, block_id, full_transactions: bool = False):
+        return await self.rpc(self.w3.eth.get_block, block_id, full_transactions=full_transactions)
+
+    async def get_blocks(self, numbers: Sequence[int], full_transactions: bool = False) -> list:
+        """Fetches several blocks in a single JSON-RPC batch request."""
+        return await self.batch([(self.w3.eth.get_block, (n, full_transactions)) for n in numbers])
+
+    async def batch(self, calls: Sequence[Tuple[Callable[..., Any], tuple]]) -> list:
+        """Runs (w3 method, args) pairs as one JSON-RPC batch, or concurrently if the provider cannot batch."""
+        if self.batch_supported:
+            try:
+                return await self._batch(calls)
+            except Web3TypeError:
+                # Provider cannot batch (e.g. eth-tester); fall back to concurrent calls.
+                self.batch_supported = False
+        return list(await asyncio.gather(*(self.rpc(fn, *args) for fn, args in calls)))
+
+    async def _batch(self, calls: Sequence[Tuple[Callable[..., Any], tuple]]) -> list:
+        if self.is_async:
+            async with self.w3.batch_requests() as batch:
+                for fn, args in calls:
+                    batch.add(fn(*args))
+                return list(await batch.async_execute())
+
+        def execute():
+            with self.w3.batch_requests() as batch:
+                for fn, args in calls:
+                    batch.add(fn(*args))
+                return list(batch.execute())
+        return await self.run_sync(execute)
+
+    async def raw_batch(self, method: str, params: Sequence[list]) -> list:
+        """Sends one raw JSON-RPC method for each params list and returns the unformatted results.
+
+        Unlike ``batch`` a null or failed result does not fail the whole batch;
+        errors come back as None.
+        """
+        provider = self.w3.provider
+        requests_ = [(method, p) for p in params]
+        responses = None
+        if self.batch_supported:
+            try:
+                responses = await self.rpc(provider.make_batch_request, requests_)
+            except (AttributeError, NotImplementedError, Web3TypeError):
+                self.batch_supported = False
+        if responses is None:
+            responses = await asyncio.gather(*(self.rpc(provider.make_request, m, p) for m, p in requests_))
+        results = []
+        for r in responses:
+            if "error" in r:
+                log.info("%s failed: %s", method, r["error"])
+            results.append(r.get("result"))
+        return results
+
+    async def iter_blocks(self, start: int, end: int, full_transactions: bool = True, batch_size: Optional[int] = None, max_in_flight: Optional[int] = None) -> AsyncIterator[Any]:
+        """Yields blocks start..end (inclusive) in order, keeping up to max_in_flight batches outstanding."""
+        batch_size = batch_size or self.scan_batch_size
+        max_in_flight = max_in_flight or self.scan_max_in_flight
+        ranges = iter(range(s, min(s + batch_size, end + 1)) for s in range(start, end + 1, batch_size))
+        pending: Deque[asyncio.Future] = deque(
+            asyncio.ensure_future(self.get_blocks(r, full_transactions)) for r in islice(ranges, max_in_flight)
+        )
+        try:
+            while pending:
+                blocks = await pending.popleft()
+                nxt = next(ranges, None)
+                if nxt is not None:
+                    pending.append(asyncio.ensure_future(self.get_blocks(nxt, full_transactions)))
+                for block in blocks:
+                    yield block
+        finally:
+            for fut in pending:
+                fut.cancel()
+
+    async def scan_address(self, address: str, start: int, end: int, batch_size: Optional[int] = None, max_in_flight: Optional[int] = None) -> AsyncIterator[Tuple[int, str]]:
+        """Streams (block number, tx hash) for transactions from or to address in start..end."""
+        target = address.lower()
+        async with contextlib.aclosing(self.iter_blocks(start, end, True, batch_size, max_in_flight)) as blocks:
+            async for block in blocks:
+                for tx in block.transactions:
+                    frm = tx.get("from")
+                    to = tx.get("to")
+                    if (frm and frm.lower() == target) or (to and to.lower() == target):
+                        yield block.number, tx["hash"].hex()
+
+    async def get_balance(self, address: str) -> Decimal:
         checksum = Web3.to_checksum_address(address)
-        wei = self.w3.eth.get_balance(checksum)
+        if self.cache is None:
+            wei = await self.rpc(self.w3.eth.get_balance, checksum)
+        else:
+            wei = await self.cache.get("balance", checksum, lambda block: self.rpc(self.w3.eth.get_balance, checksum, block))
         return Decimal(wei) / Decimal(10**18)
 
+    def state_changed(self):
+        """Called after a local write so cached reads do not hide it."""
+        if self.cache is not None:
+            self.cache.invalidate()
+
+    def contract(self, address: str, abi: list):
+        return self.w3.eth.contract(address=Web3.to_checksum_address(address), abi=abi)
+
+    async def call(self, contract_fn) -> Any:
+        return await self.rpc(contract_fn.call)
+
     def _gwei_to_wei(self, g: Decimal) -> int:
         return int((g * Decimal(10**9)).to_integral_value(rounding=ROUND_DOWN))
 
-    def get_gas_price(self) -> int:
-        if self.gas_price_gwei:
-            return self._gwei_to_wei(Decimal(self.gas_price_gwei))
-        return self.w3.eth.gas_price
+    async def get_gas_price(self) -> int:
+        return await self.fees.gas_price()
 
-    def build_tx(self, from_addr: str, to: Optional[str], value_wei: int, data: bytes = b"") -> TxParams:
+    async def build_tx(self, from_addr: str, to: Optional[str], value_wei: int, data: bytes = b"") -> TxParams:
         tx: TxParams = {
             "chainId": self.chain_id,
             "from": Web3.to_checksum_address(from_addr),
             "to": Web3.to_checksum_address(to) if to else None,
             "value": value_wei,
             "data": data,
-            "gasPrice": self.get_gas_price(),
         }
-        tx["nonce"] = self.w3.eth.get_transaction_count(from_addr)
-        estimate_dict = {k: v for k, v in tx.items() if v is not None}
-        gas_est = self.w3.eth.estimate_gas(estimate_dict)
-        tx["gas"] = int(gas_est * 1.2)
+        fees, tx["gas"] = await asyncio.gather(self.fees.fee_fields(), self.fees.estimate_gas(tx))
+        tx.update(fees)
+        # Reserved last so a failed estimate does not leave a gap.
+        tx["nonce"] = await self.nonces.reserve(tx["from"])
         return tx
 
-    def sign_and_send(self, acct: LocalAccount, tx: TxParams) -> str:
-        signed = acct.sign_transaction(tx)
-        raw = None
-        if hasattr(signed, "rawTransaction"):
-            raw = getattr(signed, "rawTransaction")
-        elif hasattr(signed, "raw_transaction"):
-            raw = getattr(signed, "raw_transaction")
-        else:
+    async def _pending_nonce(self, address: str) -> int:
+        return await self.rpc(self.w3.eth.get_transaction_count, address, "pending")
+
+    async def _sign_and_broadcast(self, acct: LocalAccount, tx: TxParams) -> str:
+        signed = await self.run_sync(acct.sign_transaction, tx)
+        raw = raw_transaction(signed)
+        try:
+            tx_hash = await self.rpc(self.w3.eth.send_raw_transaction, raw)
+        except Exception as e:
+            if not is_already_known(e):
+                raise
+            # e.g. a retried broadcast that had reached the node; resending would spend twice.
+            return Web3.keccak(raw).hex()
+        return tx_hash.hex()
+
+    async def sign_and_send(self, acct: LocalAccount, tx: TxParams, chat_id: Optional[int] = None) -> str:
+        """Signs and broadcasts tx; if a receipt tracker is set, chat_id is told the outcome."""
+        try:
+            tx_hash = await self._sign_and_broadcast(acct, tx)
+        except Exception as e:
+            if not is_nonce_error(e):
+                self.nonces.release(acct.address, tx["nonce"])
+                raise
+            log.warning("Nonce %s rejected for %s (%s); resyncing", tx["nonce"], acct.address, e)
+            await self.nonces.resync(acct.address)
+            tx = {**tx, "nonce": await self.nonces.reserve(acct.address)}
             try:
-                raw = signed["rawTransaction"]
+                tx_hash = await self._sign_and_broadcast(acct, tx)
             except Exception:
-                raw = None
-        if raw is None:
-            raise RuntimeError("Could not find raw transaction bytes on signed transaction (version mismatch)")
-        tx_hash = self.w3.eth.send_raw_transaction(raw)
-        return tx_hash.hex()
+                self.nonces.release(acct.address, tx["nonce"])
+                raise
+        self.state_changed()
+        if self.receipts is not None:
+            self.receipts.track(tx_hash, acct.address, tx["nonce"], chat_id)
+        return tx_hash
 
-    def send_eth(self, acct: LocalAccount, to: str, value_wei: int) -> str:
-        tx = self.build_tx(acct.address, to, value_wei)
-        return self.sign_and_send(acct, tx)
+    async def send_eth(self, acct: LocalAccount, to: str, value_wei: int, chat_id: Optional[int] = None) -> str:
+        tx = await self.build_tx(acct.address, to, value_wei)
+        return await self.sign_and_send(acct, tx, chat_id)
 
-    def faucet(self, to: str, amount_wei: int) -> str:
-        if not self.faucet_pk:
+    async def faucet(self, to: str, amount_wei: int, chat_id: Optional[int] = None) -> str:
+        if self.faucet_account is None:
             raise RuntimeError("Faucet not configured")
-        faucet_acct = Account.from_key(self.faucet_pk)
-        tx = self.build_tx(faucet_acct.address, to, amount_wei)
-        return self.sign_and_send(faucet_acct, tx)
+        tx = await self.build_tx(self.faucet_account.address, to, amount_wei)
+        return await self.sign_and_send(self.faucet_account, tx, chat_id)
+
+    async def close(self):
+        if self.is_async:
+            with contextlib.suppress(NotImplementedError):
+                await self.w3.provider.disconnect()
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import multiprocessing
+import queue
+from typing import Any, Callable, Dict, Optional
+
+from telegram import Update
+from telegram.ext import Application, ContextTypes
+
+log = logging.getLogger(__name__)
+
+# These sign with the faucet account, which only worker 0 holds.
+FAUCET_COMMANDS = ("faucet", "faucet_stats")
+
+
+def worker_for(update: Update, workers: int) -> int:
+    """The worker that owns this update: by user, so a user's account, nonces and conversations stay in one process."""
+    message = update.effective_message
+    text = message.text if message is not None else None
+    if text and text.startswith("/"):
+        command = text[1:].split(maxsplit=1)[0].split("@")[0].lower() if len(text) > 1 else ""
+        if command in FAUCET_COMMANDS:
+            return 0
+    if update.effective_user is not None:
+        return update.effective_user.id % workers
+    if update.effective_chat is not None:
+        return update.effective_chat.id % workers
+    return 0
+
+
+def owns_user(user_id: int, worker_id: int, workers: int) -> bool:
+    return user_id % workers == worker_id
+
+
+class UpdateRouter:
+    """Front end for WORKERS > 1: receives updates and hands each one to its owning worker process.
+
+    Workers are spawned with ``target(worker_id, workers, inbox)`` and read
+    update dicts from their inbox; ``None`` tells them to shut down. If a
+    worker exits on its own the front end stops too, so the deployment never
+    silently loses a share of its users.
+    """
+
+    def __init__(self, workers: int, target: Callable[[int, int, Any], None], poll_interval: float = 1.0):
+        ctx = multiprocessing.get_context("spawn")
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.inboxes = [ctx.Queue() for _ in range(workers)]
+        self.processes = [
+            ctx.Process(target=target, args=(i, workers, inbox), name=f"etm-worker-{i}")
+            for i, inbox in enumerate(self.inboxes)
+        ]
+        self.error: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        for p in self.processes:
+            p.start()
+
+    async def forward(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        self.inboxes[worker_for(update, self.workers)].put(update.to_dict())
+
+    async def watch(self, app: Application):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            for i, p in enumerate(self.processes):
+                if not p.is_alive():
+                    self.error = f"Worker {i} exited with code {p.exitcode}"
+                    app.stop_running()
+                    return
+
+    def start_watching(self, app: Application):
+        if self._task is None:
+            self._task = asyncio.create_task(self.watch(app), name="worker-watch")
+
+    async def stop_watching(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stop(self, timeout: float = 10.0):
+        """Asks every worker to finish its in-flight updates and exit; called after the front end has stopped."""
+        for p, inbox in zip(self.processes, self.inboxes):
+            if p.is_alive():
+                inbox.put(None)
+        for p in self.processes:
+            p.join(timeout)
+            if p.is_alive():
+                log.warning("%s did not stop in %ss; terminating", p.name, timeout)
+                p.terminate()
+                p.join()
+
+
+async def serve_updates(app: Application, inbox: Any, startup: Dict[str, Any]):
+    """Runs app without an Updater, feeding it the updates the front end forwards.
+
+    Mirrors what run_polling does around the updater: initialize, post_init,
+    start, then stop, post_stop, shutdown and post_shutdown. A fatal startup
+    error sets ``startup["error"]`` and calls ``startup["stop"]``.
+    """
+    loop = asyncio.get_running_loop()
+    stopped = asyncio.Event()
+    startup["stop"] = stopped.set
+    await app.initialize()
+    try:
+        if app.post_init:
+            await app.post_init(app)
+        await app.start()
+        while not stopped.is_set():
+            try:
+                # Short timeout so a stop request is noticed without a message.
+                data = await loop.run_in_executor(None, inbox.get, True, 0.2)
+            except queue.Empty:
+                continue
+            if data is None:
+                break
+            await app.update_queue.put(Update.de_json(data, app.bot))
+    finally:
+        if app.running:
+            await app.stop()
+            if app.post_stop:
+                await app.post_stop(app)
+        await app.shutdown()
+        if app.post_shutdown:
+            await app.post_shutdown(app)
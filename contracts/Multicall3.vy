@@ -0,0 +1,39 @@
+# pragma version ~=0.4.3
+"""
+@title Multicall3 subset
+@notice ABI-compatible with aggregate3() and getEthBalance() of Multicall3
+        (0xcA11bde05977b3631167028862bE2a173976CA11), for dev chains that do
+        not have it. Calldata and return data are capped at 128 bytes, which
+        covers ERC-20 balanceOf/decimals/symbol.
+"""
+
+MAX_CALLS: constant(uint256) = 512
+
+
+struct Call3:
+    target: address
+    allowFailure: bool
+    callData: Bytes[128]
+
+
+struct Result:
+    success: bool
+    returnData: Bytes[128]
+
+
+@external
+def aggregate3(calls: DynArray[Call3, MAX_CALLS]) -> DynArray[Result, MAX_CALLS]:
+    results: DynArray[Result, MAX_CALLS] = []
+    for c: Call3 in calls:
+        success: bool = False
+        data: Bytes[128] = b""
+        success, data = raw_call(c.target, c.callData, max_outsize=128, is_static_call=True, revert_on_failure=False)
+        assert success or c.allowFailure, "Multicall3: call failed"
+        results.append(Result(success=success, returnData=data))
+    return results
+
+
+@view
+@external
+def getEthBalance(addr: address) -> uint256:
+    return addr.balance
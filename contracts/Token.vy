@@ -0,0 +1,31 @@
+# pragma version ~=0.4.3
+# Minimal ERC-20 used by the offline benchmarks (compiled into benchmarks/token.py).
+
+event Transfer:
+    sender: indexed(address)
+    receiver: indexed(address)
+    value: uint256
+
+name: public(String[32])
+symbol: public(String[32])
+decimals: public(uint8)
+totalSupply: public(uint256)
+balanceOf: public(HashMap[address, uint256])
+
+
+@deploy
+def __init__(_symbol: String[32], _decimals: uint8, _supply: uint256):
+    self.name = _symbol
+    self.symbol = _symbol
+    self.decimals = _decimals
+    self.totalSupply = _supply
+    self.balanceOf[msg.sender] = _supply
+    log Transfer(sender=empty(address), receiver=msg.sender, value=_supply)
+
+
+@external
+def transfer(_to: address, _value: uint256) -> bool:
+    self.balanceOf[msg.sender] -= _value
+    self.balanceOf[_to] += _value
+    log Transfer(sender=msg.sender, receiver=_to, value=_value)
+    return True
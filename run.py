@@ -1,45 +1,184 @@
 # - This code is intended for local testing only. Do NOT use real mnemonics/private keys on mainnet.
 
-import logging
-from web3 import Web3
-from telegram.ext import ApplicationBuilder, ConversationHandler, MessageHandler, filters
-from telegram.ext import CommandHandler
+import time
+
+STARTED = time.perf_counter()
 
+import asyncio
+import logging
+import secrets
 
 from bot.config import config
-from bot.storage import JSONStorage
-from bot.wallet import WalletManager
-from bot.handlers import Handlers, SEND_TO, SEND_AMOUNT, TSYMBOL, TTO, TAMOUNT, SIGN_MSG, VERIFY_AWAIT
+from bot.startup import StartupReport
 
 logging.basicConfig(level=logging.WARNING)
 
+# The web3/eth_account and telegram stacks are imported inside main(): the
+# worker processes started for /sign_bulk re-import this module and do not
+# need them.
 
-def main():
-    w3 = Web3(Web3.HTTPProvider(config.RPC_URL))
-    if not w3.is_connected():
-        raise SystemExit(f"Cannot connect to RPC at {config.RPC_URL}. Is Anvil running??")
 
-    storage = JSONStorage()
-    wallet = WalletManager(w3, config.WALLET_MNEMONIC, config.CHAIN_ID, gas_price_gwei=config.GAS_PRICE_GWEI, faucet_pk=config.FAUCET_PRIVATE_KEY)
-    handlers = Handlers(wallet, storage)
+def build_web3():
+    from web3 import AsyncWeb3, Web3
+    from bot.providers import AsyncPooledHTTPProvider, PooledHTTPProvider
+
+    if config.RPC_ASYNC:
+        return AsyncWeb3(AsyncPooledHTTPProvider(config.RPC_URLS, pool_size=config.RPC_POOL_SIZE, timeout=config.RPC_TIMEOUT, health_interval=config.RPC_HEALTH_INTERVAL))
+    return Web3(PooledHTTPProvider(config.RPC_URLS, pool_size=config.RPC_POOL_SIZE, timeout=config.RPC_TIMEOUT))
+
+
+def build_application(report: StartupReport, worker_id: int = 0, workers: int = 1, w3=None, request=None):
+    """Builds the bot Application; with workers > 1 it is one worker, fed by the front end instead of an Updater.
+
+    ``w3`` replaces the configured RPC client and ``request`` the Bot API
+    transport (the load harness passes a local chain and a stub). Returns
+    (app, startup); startup["error"] is set if the node never answered.
+    """
+    from telegram.ext import ApplicationBuilder, CommandHandler, ConversationHandler, MessageHandler, filters
+
+    from bot.storage import JSONStorage, MemoryStorage, SQLiteStorage
+    from bot.wallet import WalletManager
+    from bot.indexer import TxIndexer
+    from bot.faucet import FaucetDispenser
+    from bot.receipts import ReceiptTracker
+    from bot.chaincache import BlockCache
+    from bot.metrics import metrics, timed_request
+    from bot.updates import PerUserUpdateProcessor
+    from bot.admission import AdmissionController, PRIORITY_FAUCET, PRIORITY_HISTORY, PRIORITY_SEND, PRIORITY_TOKEN
+    from bot.multicall import Multicall
+    from bot.providers import AsyncPooledHTTPProvider, MetricsMiddleware
+    from bot.handlers import Handlers, SEND_TO, SEND_AMOUNT, TSYMBOL, TTO, TAMOUNT, SIGN_MSG, VERIFY_AWAIT, BULK_FILE
+    from bot.workers import owns_user
+    report.mark("imports")
+    # Background services that write or sign for shared accounts run in worker 0 only.
+    leader = worker_id == 0
+
+    if w3 is None:
+        w3 = build_web3()
+    if config.METRICS_ENABLED:
+        metrics.enable()
+        w3.middleware_onion.add(MetricsMiddleware, "metrics")
+    if config.STORAGE_BACKEND == "sqlite":
+        storage = SQLiteStorage()
+    elif config.STORAGE_BACKEND == "memory":
+        storage = MemoryStorage(flush_interval=config.STORAGE_FLUSH_SECONDS)
+    else:
+        storage = JSONStorage()
+    # The faucet account is owned by worker 0, which gets every /faucet.
+    faucet_pk = config.FAUCET_PRIVATE_KEY if leader else None
+    wallet = WalletManager(w3, config.WALLET_MNEMONIC, config.CHAIN_ID, gas_price_gwei=config.GAS_PRICE_GWEI, faucet_pk=faucet_pk, derivation_cache_size=config.DERIVATION_CACHE_SIZE, executor_workers=config.RPC_EXECUTOR_WORKERS, scan_batch_size=config.SCAN_BATCH_SIZE, scan_max_in_flight=config.SCAN_MAX_IN_FLIGHT, fee_mode=config.FEE_MODE, fee_cache_seconds=config.FEE_CACHE_SECONDS)
+    indexer = TxIndexer(wallet, start_block=config.INDEX_START_BLOCK, poll_interval=config.INDEX_POLL_SECONDS) if config.INDEXER_ENABLED else None
+    if config.BLOCK_CACHE_ENABLED:
+        wallet.cache = BlockCache(wallet, max_entries=config.BLOCK_CACHE_SIZE, poll_interval=config.HEAD_POLL_SECONDS, report_interval=config.BLOCK_CACHE_REPORT_SECONDS)
+    if config.RECEIPTS_ENABLED:
+        wallet.receipts = ReceiptTracker(wallet, poll_interval=config.RECEIPTS_POLL_SECONDS, drop_after_blocks=config.RECEIPTS_DROP_AFTER_BLOCKS, max_pending=config.RECEIPTS_MAX_PENDING)
+    dispenser = FaucetDispenser(wallet, window=config.FAUCET_BATCH_WINDOW, max_batch=config.FAUCET_MAX_BATCH, use_set_balance=config.FAUCET_ANVIL_SET_BALANCE) if faucet_pk else None
+    multicall = Multicall(wallet, address=config.MULTICALL_ADDRESS)
+    handlers = Handlers(wallet, storage, indexer=indexer, faucet=dispenser, multicall=multicall)
+    admission = AdmissionController(global_limit=config.ADMISSION_GLOBAL_LIMIT, per_user=config.ADMISSION_PER_USER, rate=config.ADMISSION_RATE, burst=config.ADMISSION_BURST, max_queue=config.ADMISSION_MAX_QUEUE)
+
+    startup = {}
 
-    app = ApplicationBuilder().token(config.BOT_TOKEN).build()
+    async def check_rpc():
+        connected = await wallet.is_connected()
+        report.mark("rpc")
+        return connected
+
+    async def warm_up():
+        # Known users' accounts (this worker's users only); the most recently
+        # registered if the cache cannot hold them all.
+        owned = [idx for user, idx in (await storage.run_sync(storage.get_users)).items() if owns_user(int(user), worker_id, workers)]
+        indices = sorted(owned)[-config.DERIVATION_CACHE_SIZE:] if config.DERIVATION_CACHE_SIZE > 0 else []
+        await wallet.run_sync(wallet.derive_many, indices)
+        startup["warmed"] = len(indices)
+        report.mark("warm_up")
+
+    async def wait_running(app):
+        # PTB has no post-start hook; polling starts right after post_init.
+        while not app.running:
+            await asyncio.sleep(0.01)
+        report.mark("ready")
+
+    async def startup_checks(app):
+        connected, _, _ = await asyncio.gather(check_rpc(), warm_up(), wait_running(app))
+        if not connected:
+            startup["error"] = f"Cannot connect to RPC at {', '.join(config.RPC_URLS)}. Is Anvil running??"
+            startup.get("stop", app.stop_running)()
+            return
+        if wallet.cache is not None:
+            wallet.cache.start()
+        if indexer is not None and leader:
+            # One process follows the chain; the others read the same SQLite index.
+            indexer.start()
+        if dispenser is not None:
+            dispenser.start()
+        if wallet.receipts is not None:
+            wallet.receipts.notify = app.bot.send_message
+            wallet.receipts.start()
+        who = f"Worker {worker_id} startup" if workers > 1 else "Startup"
+        print(f"{who}: {report.summary()} ({startup['warmed']} accounts cached)")
+
+    # The async provider binds its HTTP session to the running loop, so the
+    # connectivity check has to happen inside the application's loop. It runs
+    # next to polling start-up instead of before it; the services that need
+    # the node start once it has answered.
+    async def post_init(app):
+        report.mark("telegram")
+        startup["task"] = asyncio.create_task(startup_checks(app))
+        if isinstance(w3.provider, AsyncPooledHTTPProvider):
+            w3.provider.start()
+        if metrics.enabled:
+            await metrics.serve(config.METRICS_HOST, config.METRICS_PORT + worker_id)
+
+    async def post_shutdown(app):
+        task = startup.get("task")
+        if task is not None and not task.done():
+            task.cancel()
+        if indexer is not None:
+            await indexer.stop()
+        if dispenser is not None:
+            await dispenser.stop()
+        if wallet.receipts is not None:
+            await wallet.receipts.stop()
+        if wallet.cache is not None:
+            await wallet.cache.stop()
+        await wallet.close()
+        storage.close()
+        handlers.signer.close()
+        await metrics.stop()
+
+    builder = ApplicationBuilder().token(config.BOT_TOKEN).post_init(post_init).post_shutdown(post_shutdown)
+    if config.CONCURRENT_UPDATES > 0:
+        builder = builder.concurrent_updates(PerUserUpdateProcessor(config.CONCURRENT_UPDATES))
+    if request is not None:
+        builder = builder.request(request)
+    elif metrics.enabled:
+        builder = builder.request(timed_request())
+    if workers > 1:
+        builder = builder.updater(None)
+    app = builder.build()
 
     app.add_handler(CommandHandler("start", handlers.start))
     app.add_handler(CommandHandler("help", handlers.help))
     app.add_handler(CommandHandler("new", handlers.new_wallet))
     app.add_handler(CommandHandler("address", handlers.address))
     app.add_handler(CommandHandler("balance", handlers.balance))
-    app.add_handler(CommandHandler("faucet", handlers.faucet))
-    app.add_handler(CommandHandler("history", handlers.history))
-    app.add_handler(CommandHandler("token_add", handlers.token_add))
-    app.add_handler(CommandHandler("token_balance", handlers.token_balance))
+    # Expensive commands go through admission control and run as tasks
+    # (block=False), so cheap commands are not stuck behind them.
+    app.add_handler(CommandHandler("faucet", admission.wrap(handlers.faucet, PRIORITY_FAUCET), block=False))
+    app.add_handler(CommandHandler("faucet_stats", handlers.faucet_stats))
+    app.add_handler(CommandHandler("pending", handlers.pending))
+    app.add_handler(CommandHandler("history", admission.wrap(handlers.history, PRIORITY_HISTORY), block=False))
+    app.add_handler(CommandHandler("token_add", admission.wrap(handlers.token_add, PRIORITY_TOKEN), block=False))
+    app.add_handler(CommandHandler("token_balance", admission.wrap(handlers.token_balance, PRIORITY_TOKEN), block=False))
+    app.add_handler(CommandHandler("token_history", admission.wrap(handlers.token_history, PRIORITY_HISTORY), block=False))
+    app.add_handler(CommandHandler("portfolio", admission.wrap(handlers.portfolio, PRIORITY_TOKEN), block=False))
 
     send_conv = ConversationHandler(
         entry_points=[CommandHandler("send", handlers.send_start)],
         states={
             SEND_TO: [MessageHandler(filters.TEXT & ~filters.COMMAND, handlers.send_got_to)],
-            SEND_AMOUNT: [MessageHandler(filters.TEXT & ~filters.COMMAND, handlers.send_got_amount)],
+            SEND_AMOUNT: [MessageHandler(filters.TEXT & ~filters.COMMAND, admission.wrap(handlers.send_got_amount, PRIORITY_SEND, on_reject=ConversationHandler.END), block=False)],
         },
         fallbacks=[CommandHandler("cancel", handlers.send_cancel)],
     )
@@ -50,7 +189,7 @@ def main():
         states={
             TSYMBOL: [MessageHandler(filters.TEXT & ~filters.COMMAND, handlers.token_send_symbol)],
             TTO: [MessageHandler(filters.TEXT & ~filters.COMMAND, handlers.token_send_to)],
-            TAMOUNT: [MessageHandler(filters.TEXT & ~filters.COMMAND, handlers.token_send_amount)],
+            TAMOUNT: [MessageHandler(filters.TEXT & ~filters.COMMAND, admission.wrap(handlers.token_send_amount, PRIORITY_SEND, on_reject=ConversationHandler.END), block=False)],
         },
         fallbacks=[CommandHandler("cancel", handlers.send_cancel)],
     )
@@ -70,8 +209,111 @@ def main():
     )
     app.add_handler(verify_conv)
 
-    print("Bot is running (polling). Ctrl+C to stop.")
-    app.run_polling()
+    # The upload step does the heavy work, so it is the part behind admission control.
+    upload = filters.Document.ALL | (filters.TEXT & ~filters.COMMAND)
+    sign_bulk_conv = ConversationHandler(
+        entry_points=[CommandHandler("sign_bulk", handlers.sign_bulk_start)],
+        states={BULK_FILE: [MessageHandler(upload, admission.wrap(handlers.sign_bulk_finish, PRIORITY_HISTORY, on_reject=ConversationHandler.END), block=False)]},
+        fallbacks=[CommandHandler("cancel", handlers.send_cancel)],
+    )
+    app.add_handler(sign_bulk_conv)
+
+    verify_bulk_conv = ConversationHandler(
+        entry_points=[CommandHandler("verify_bulk", handlers.verify_bulk_start)],
+        states={BULK_FILE: [MessageHandler(upload, admission.wrap(handlers.verify_bulk_finish, PRIORITY_HISTORY, on_reject=ConversationHandler.END), block=False)]},
+        fallbacks=[CommandHandler("cancel", handlers.send_cancel)],
+    )
+    app.add_handler(verify_bulk_conv)
+
+    send_batch_conv = ConversationHandler(
+        entry_points=[CommandHandler("send_batch", handlers.send_batch_start)],
+        states={BULK_FILE: [MessageHandler(upload, admission.wrap(handlers.send_batch_finish, PRIORITY_SEND, on_reject=ConversationHandler.END), block=False)]},
+        fallbacks=[CommandHandler("cancel", handlers.send_cancel)],
+    )
+    app.add_handler(send_batch_conv)
+
+    if metrics.enabled:
+        metrics.instrument_application(app)
+    report.mark("build")
+    return app, startup
+
+
+def run_application(app):
+    if config.BOT_MODE == "webhook":
+        secret = config.WEBHOOK_SECRET or secrets.token_urlsafe(32)
+        path = config.WEBHOOK_PATH.strip("/")
+        print(f"Bot is running (webhook on {config.WEBHOOK_LISTEN}:{config.WEBHOOK_PORT}/{path}). Ctrl+C to stop.")
+        app.run_webhook(
+            listen=config.WEBHOOK_LISTEN,
+            port=config.WEBHOOK_PORT,
+            url_path=path,
+            webhook_url=f"{config.WEBHOOK_URL.rstrip('/')}/{path}",
+            secret_token=secret,
+            max_connections=config.WEBHOOK_MAX_CONNECTIONS,
+        )
+    else:
+        print("Bot is running (polling). Ctrl+C to stop.")
+        app.run_polling()
+
+
+def serve_worker(worker_id: int, workers: int, inbox):
+    """Entry point of a worker process started by the front end."""
+    import signal
+
+    from bot.workers import serve_updates
+
+    # Ctrl+C reaches the whole process group; the front end decides when workers stop.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # STARTED was set again when this process imported run.py.
+    report = StartupReport(STARTED)
+    config.load()
+    app, startup = build_application(report, worker_id, workers)
+    asyncio.run(serve_updates(app, inbox, startup))
+    if "error" in startup:
+        raise SystemExit(startup["error"])
+
+
+def run_front_end():
+    """Receives updates (polling or webhook) and routes each one to the worker that owns its user."""
+    from telegram import Update
+    from telegram.ext import ApplicationBuilder, TypeHandler
+
+    from bot.workers import UpdateRouter
+
+    router = UpdateRouter(config.WORKERS, serve_worker)
+
+    async def post_init(app):
+        router.start_watching(app)
+
+    async def post_shutdown(app):
+        await router.stop_watching()
+
+    builder = ApplicationBuilder().token(config.BOT_TOKEN).post_init(post_init).post_shutdown(post_shutdown)
+    app = builder.build()
+    app.add_handler(TypeHandler(Update, router.forward))
+    router.start()
+    print(f"Started {config.WORKERS} workers")
+    try:
+        run_application(app)
+    finally:
+        router.stop()
+    if router.error:
+        raise SystemExit(router.error)
+
+
+def main():
+    report = StartupReport(STARTED)
+    config.load()
+    config.validate()
+    if config.WORKERS > 1:
+        if config.STORAGE_BACKEND != "sqlite":
+            raise SystemExit("WORKERS > 1 needs STORAGE_BACKEND=sqlite so the workers share users and tokens")
+        run_front_end()
+        return
+    app, startup = build_application(report)
+    run_application(app)
+    if "error" in startup:
+        raise SystemExit(startup["error"])
 
 
 if __name__ == "__main__":